@@ -0,0 +1,86 @@
+"""Per-query latency with and without the resident daemon.
+
+Runs each query as a fresh ``python`` process (as a shell user would) against
+a local stub of the completions endpoint, first in-process and then through
+``groq-cli daemon``. The stub charges a per-connection delay to stand in for
+the TCP/TLS handshake that the daemon's warm connection avoids.
+
+Usage: python benchmarks/bench_daemon.py [--queries N] [--connect-delay S]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+CLIENT = (
+    "import sys, groq_cli; "
+    "groq_cli.request_commands(sys.argv[1], use_cache=False)"
+)
+
+
+def run_queries(count, env):
+    samples = []
+    for idx in range(count):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", CLIENT, f"disk usage {idx}"],
+            cwd=ROOT, env=env, check=True,
+        )
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    print(
+        f"{label:>10}: median {statistics.median(samples) * 1000:7.1f} ms  "
+        f"max {max(samples) * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--connect-delay", type=float, default=0.05)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer(
+        delay=args.delay, connect_delay=args.connect_delay
+    ) as stub:
+        env = dict(
+            os.environ,
+            GROQ_API_KEY="stub",
+            GROQ_BASE_URL=stub.url,
+            GROQ_CLI_CACHE_DIR=tmp,
+            GROQ_CLI_SOCKET=os.path.join(tmp, "daemon.sock"),
+        )
+        report("no daemon", run_queries(args.queries, env))
+        print(f"{'':>10}  {stub.connections} connections opened")
+
+        stub.connections = 0
+        daemon = subprocess.Popen(
+            [sys.executable, "groq_cli.py", "daemon"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            while not os.path.exists(env["GROQ_CLI_SOCKET"]):
+                if daemon.poll() is not None:
+                    sys.exit("daemon failed to start")
+                time.sleep(0.05)
+            report("daemon", run_queries(args.queries, env))
+            print(f"{'':>10}  {stub.connections} connections opened")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Matching throughput of the local error-triage rules.
+
+Compares the combined regex that triage_error() scans with trying each
+rule's pattern in turn, and reports the cost of a full triage_error() call
+(match plus building the analysis), on a corpus of real stderr samples
+including some that no rule matches.
+
+Usage: python benchmarks/bench_error_rules.py [--rounds N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from groq_cli import (  # noqa: E402
+    ERROR_RULES,
+    _compile_error_rules,
+    triage_error,
+)
+
+CORPUS = [
+    "bash: line 1: speedtest-cli: command not found",
+    "bash: htop: command not found",
+    "sh: 1: jq: not found",
+    "/bin/sh: 1: kubectl: not found",
+    "ls: cannot open directory '/root': Permission denied",
+    "bash: /etc/hosts: Permission denied",
+    "mkdir: cannot create directory '/opt/app': Permission denied",
+    "E: Could not open lock file /var/lib/dpkg/lock-frontend - open "
+    "(13: Permission denied)",
+    "cp: error writing '/mnt/backup/db.tar': No space left on device",
+    "tar: ./logs/app.log: Wrote only 4096 of 10240 bytes\n"
+    "tar: Exiting with failure status due to previous errors: "
+    "No space left on device",
+    "curl: (6) Could not resolve host: api.example.internal",
+    "ping: github.com: Temporary failure in name resolution",
+    "ssh: Could not resolve hostname build-07: Name or service not known",
+    "cat: /var/log/nginx/access.log.1: No such file or directory",
+    "ls: cannot access 'node_modules': No such file or directory",
+    "curl: (7) Failed to connect to localhost port 5432 after 0 ms: "
+    "Connection refused",
+    "psql: error: connection to server on socket "
+    "\"/var/run/postgresql/.s.PGSQL.5432\" failed: Connection refused",
+    "Error starting userland proxy: listen tcp4 0.0.0.0:80: bind: "
+    "Address already in use",
+    "touch: cannot touch '/boot/test': Read-only file system",
+    "E: Unable to locate package htop2",
+    "E: Could not get lock /var/lib/dpkg/lock-frontend. It is held by "
+    "process 4242 (apt-get)",
+    "java.io.IOException: Too many open files",
+    "fork: Cannot allocate memory",
+    # Misses that fall through to the API
+    "fatal: not a git repository (or any of the parent directories): .git",
+    "error: failed to push some refs to 'origin'",
+    "Segmentation fault (core dumped)",
+    "make: *** [Makefile:12: all] Error 2",
+    "docker: Error response from daemon: pull access denied for foo, "
+    "repository does not exist",
+    "rsync error: some files/attrs were not transferred (code 23)",
+    "Traceback (most recent call last):\n  File \"app.py\", line 3\n"
+    "KeyError: 'PORT'",
+]
+
+
+def per_rule_triage(error_text, patterns):
+    for pattern in patterns:
+        match = pattern.search(error_text)
+        if match is not None:
+            return match
+    return None
+
+
+def measure(label, func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in CORPUS:
+            func(sample)
+    elapsed = time.perf_counter() - start
+    total = rounds * len(CORPUS)
+    print(f"{label:>22}: {total / elapsed:12,.0f} samples/s "
+          f"({elapsed / total * 1e6:.2f} us/sample)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    hits = sum(triage_error(sample) is not None for sample in CORPUS)
+    print(f"{len(CORPUS)} samples, {hits} answered by local rules")
+
+    combined, _ = _compile_error_rules()
+    patterns = [re.compile(rule.pattern) for rule in ERROR_RULES]
+    measure("combined regex", combined.search, args.rounds)
+    measure("per-rule regexes",
+            lambda text: per_rule_triage(text, patterns), args.rounds)
+    measure("full triage_error", triage_error, args.rounds)
+
+if __name__ == "__main__":
+    main()
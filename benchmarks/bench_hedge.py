@@ -0,0 +1,100 @@
+"""Tail latency of get_commands with and without hedged requests.
+
+Runs queries in-process against a local stub of the completions endpoint
+that answers most requests after a short delay. A seeded fraction of
+requests is slow and another fraction returns output that fails validation.
+The run is repeated without hedging and with --hedge, and the script
+reports p50/p95/p99 latency, failures and the requests sent.
+
+Usage: python benchmarks/bench_hedge.py [--queries N] [--hedge SECONDS]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import groq_cli  # noqa: E402
+from benchmarks.stub_server import Reply, StubServer  # noqa: E402
+
+
+class FlakyStub(StubServer):
+    def __init__(self, seed, slow, invalid, delay, slow_delay):
+        super().__init__(delay=delay)
+        self.rng = random.Random(seed)
+        self.slow = slow
+        self.invalid = invalid
+        self.slow_delay = slow_delay
+        self.rng_lock = threading.Lock()
+
+    def reply(self, body, index):
+        with self.rng_lock:
+            draw = self.rng.random()
+        if draw < self.slow:
+            return Reply(delay=self.slow_delay)
+        if draw < self.slow + self.invalid:
+            return Reply(content="I'm sorry, here are some commands: ls")
+        return Reply()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+def run(args, hedge):
+    stub = FlakyStub(args.seed, args.slow, args.invalid, args.delay,
+                     args.slow_delay)
+    samples = []
+    failures = 0
+    with stub:
+        os.environ["GROQ_BASE_URL"] = stub.url
+        os.environ.setdefault("GROQ_API_KEY", "stub")
+        groq_cli.get_client.cache_clear()
+        groq_cli.get_client()
+        for idx in range(args.queries):
+            start = time.perf_counter()
+            try:
+                groq_cli.get_commands(
+                    f"disk usage {idx}", use_cache=False, hedge=hedge)
+            except ValueError:
+                failures += 1
+            samples.append(time.perf_counter() - start)
+        requests = stub.requests
+    return samples, failures, requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--hedge", type=float, default=0.4,
+                        help="Hedge delay in seconds (default: 0.4)")
+    parser.add_argument("--delay", type=float, default=0.15,
+                        help="Normal response time (default: 0.15)")
+    parser.add_argument("--slow", type=float, default=0.08,
+                        help="Fraction of slow responses (default: 0.08)")
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--invalid", type=float, default=0.04,
+                        help="Fraction of invalid responses (default: 0.04)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.queries} queries, {args.slow:.0%} slow ({args.slow_delay}s), "
+          f"{args.invalid:.0%} invalid, normal response {args.delay}s")
+    print(f"{'mode':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+          f"{'failed':>8}{'requests':>10}")
+    modes = [("no hedging", None),
+             (f"hedge {args.hedge}s", groq_cli.HedgePolicy(args.hedge, None))]
+    for name, hedge in modes:
+        samples, failures, requests = run(args, hedge)
+        print(f"{name:<16}"
+              + "".join(f"{percentile(samples, p):8.2f}s" for p in (50, 95, 99))
+              + f"{max(samples):8.2f}s{failures:>8}{requests:>10}")
+
+
+if __name__ == "__main__":
+    main()
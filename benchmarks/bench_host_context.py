@@ -0,0 +1,90 @@
+"""Output tokens and latency of get_commands with and without host context.
+
+Sends each query to the API with the host description (the default) and
+without it, and reports completion tokens and end-to-end time per mode.
+Needs GROQ_API_KEY and makes real API calls.
+
+Record a baseline without host context once, then compare later runs with it:
+
+    python benchmarks/bench_host_context.py --record baseline.json
+    python benchmarks/bench_host_context.py --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import groq_cli  # noqa: E402
+
+QUERIES = [
+    "check disk space",
+    "show disk usage per folder",
+    "who is listening on port 8080",
+    "run a network speed test",
+    "find files larger than 1GB in my home directory",
+    "show the last 100 lines of the nginx error log",
+    "list installed packages sorted by size",
+    "restart the docker service",
+]
+
+
+def run(host_context, repeats):
+    groq_cli.HOST_CONTEXT = host_context
+    results = {}
+    for query in QUERIES:
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            completion = groq_cli._create_completion(
+                groq_cli._command_messages(query))
+            elapsed = time.perf_counter() - start
+            samples.append(
+                {"tokens": completion.usage.completion_tokens,
+                 "seconds": elapsed})
+        results[query] = samples
+    return results
+
+
+def summarize(results):
+    samples = [sample for runs in results.values() for sample in runs]
+    return (
+        statistics.mean(sample["tokens"] for sample in samples),
+        statistics.median(sample["seconds"] for sample in samples),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--record", help="Save the run without host context to this file")
+    parser.add_argument(
+        "--baseline", help="Compare against a run saved with --record")
+    args = parser.parse_args()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        baseline = run(False, args.repeats)
+        if args.record:
+            with open(args.record, "w") as f:
+                json.dump(baseline, f, indent=2)
+            print(f"Baseline saved to {args.record}")
+    current = run(True, args.repeats)
+
+    base_tokens, base_seconds = summarize(baseline)
+    tokens, seconds = summarize(current)
+    print(f"{'':>16} {'tokens (mean)':>14} {'time (median)':>14}")
+    print(f"{'baseline':>16} {base_tokens:14.0f} {base_seconds:13.2f}s")
+    print(f"{'host context':>16} {tokens:14.0f} {seconds:13.2f}s")
+    print(f"{'change':>16} {(tokens / base_tokens - 1) * 100:13.1f}% "
+          f"{(seconds / base_seconds - 1) * 100:13.1f}%")
+
+
+if __name__ == "__main__":
+    main()
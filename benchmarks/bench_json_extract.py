@@ -0,0 +1,99 @@
+"""Throughput and recovery rate of extract_json() against the old repair.
+
+The old path, which get_commands used before extract_json(), ran a
+backslash re.sub over the whole response, took the greedy {.*} match and
+parsed again. Both are run on responses that json.loads() rejects: prose
+around the object, unescaped backslashes, raw control characters,
+trailing commas and responses cut off mid-way. The script reports how many
+each recovers and the time per response. A long response is used to check
+that the scan stays linear.
+
+Usage: python benchmarks/bench_json_extract.py [--rounds N]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from groq_cli import extract_json  # noqa: E402
+
+
+def regex_repair(content):
+    content = re.sub(r'(?<!\\)\\(?![\\"{}])', r"\\\\", content)
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if not match:
+        raise ValueError("No valid JSON object found in the response")
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError:
+        raise ValueError("Failed to parse the response as JSON")
+
+
+COMMANDS = [
+    {"command": r"find / -type f -size +1G -exec ls -lh {} \; 2>/dev/null",
+     "description": "Find files larger than 1GB", "installation": ""},
+    {"command": "du -ah / 2>/dev/null | sort -rh | head -n 20",
+     "description": "Show the 20 largest files and folders",
+     "installation": ""},
+    {"command": "ncdu /", "description": "Browse disk usage interactively",
+     "installation": "sudo apt-get install ncdu"},
+]
+VALID = json.dumps({"commands": COMMANDS}, indent=2)
+
+CORPUS = {
+    "prose around object":
+        "Here are some commands:\n```json\n" + VALID + "\n```\nEnjoy!",
+    "unescaped backslashes":
+        VALID.replace(r"\\;", r"\;").replace(
+            "du -ah", r"grep -E '\d+' | du -ah"),
+    "raw newline in string":
+        VALID.replace("Show the 20", "Show the\n20"),
+    "trailing commas":
+        VALID.replace('""\n  }', '"",\n  }').replace("}\n  ]", "},\n  ]"),
+    "cut off mid-entry": VALID[:len(VALID) * 3 // 4],
+    "cut off mid-string": VALID[:VALID.index("ncdu /") + 2],
+}
+LONG = json.dumps({"commands": COMMANDS * 300}).replace(
+    r"\\;", r"\;") + "\nThat should cover it."
+
+
+def timed(func, text, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        try:
+            func(text)
+        except ValueError:
+            pass
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'response':<24}{'old repair':>18}{'extract_json':>18}")
+    for name, text in CORPUS.items():
+        columns = []
+        for func in (regex_repair, extract_json):
+            try:
+                found = len(func(text).get("commands", []))
+                outcome = f"{found}/3"
+            except ValueError:
+                outcome = "failed"
+            columns.append(f"{outcome} {timed(func, text, args.rounds) * 1e6:6.1f}µs")
+        print(f"{name:<24}{columns[0]:>18}{columns[1]:>18}")
+
+    rounds = max(1, args.rounds // 100)
+    for func in (regex_repair, extract_json):
+        seconds = timed(func, LONG, rounds)
+        print(f"{func.__name__} on {len(LONG) // 1024} KiB: "
+              f"{seconds * 1e3:.2f} ms ({len(LONG) / seconds / 2**20:.0f} MiB/s)")
+
+
+if __name__ == "__main__":
+    main()
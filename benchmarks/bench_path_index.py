@@ -0,0 +1,73 @@
+"""Cost of checking suggested commands against the $PATH index.
+
+Reports a cold build of the index (every directory listed), loading it from
+disk when nothing changed, an mtime recheck of the PATH directories, and the
+per-command cost of missing_binaries() once the index is loaded.
+
+Usage: python benchmarks/bench_path_index.py [--rounds N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import groq_cli  # noqa: E402
+
+COMMANDS = [
+    "df -h",
+    "du -sh * | sort -h",
+    "sudo lsof -i :8080",
+    "ss -tulpn | grep LISTEN",
+    "find ~ -type f -size +1G -exec ls -lh {} \;",
+    "docker ps -a && docker images",
+    "FOO=1 timeout 5 curl -sS https://example.com > /dev/null 2>&1",
+    "for f in *.log; do gzip \"$f\"; done",
+    "speedtest-cli --simple || echo 'not installed'",
+    "journalctl -u nginx --since today | tail -n 100",
+]
+
+
+def timed(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["GROQ_CLI_CACHE_DIR"] = tmp
+        path = os.path.join(tmp, "path_index.json")
+        names = groq_cli.PathIndex(path).refresh().names
+        directories = len(groq_cli.PathIndex(path).dirs)
+
+        def cold():
+            os.unlink(path)
+            groq_cli.PathIndex(path).refresh()
+
+        def recheck():
+            groq_cli.PathIndex(path).refresh()
+
+        index = groq_cli.get_path_index()
+
+        def resolve():
+            for command in COMMANDS:
+                groq_cli.missing_binaries(command, index)
+
+        print(f"{len(names)} executables in {directories} PATH directories")
+        print(f"cold build:          {timed(cold, 20) * 1e3:8.2f} ms")
+        print(f"load and recheck:    {timed(recheck, 100) * 1e3:8.2f} ms")
+        print(f"recheck mtimes:      {timed(index.refresh, args.rounds) * 1e6:8.2f} µs")
+        per_command = timed(resolve, args.rounds) / len(COMMANDS)
+        print(f"missing_binaries():  {per_command * 1e6:8.2f} µs per command")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Cost of the near-duplicate query index against index size.
+
+Builds an index in an SQLite file, then times what one groq-cli invocation
+pays on a miss: opening the index and the first lookup (cold), further
+lookups on the open index (warm) and recording a new entry (add).
+
+Usage: python benchmarks/bench_query_index.py [SIZE ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from groq_cli import SIMILARITY_THRESHOLD, QueryIndex  # noqa: E402
+
+VERBS = ["show", "find", "list", "count", "monitor", "kill", "compress",
+         "delete", "sort", "watch", "archive", "check", "restart", "tail"]
+OBJECTS = ["disk usage", "open ports", "large files", "log files", "processes",
+           "docker containers", "systemd services", "git branches", "users",
+           "memory usage", "network interfaces", "cron jobs", "packages"]
+QUALIFIERS = ["per folder", "older than 7 days", "by size", "for user bob",
+              "on port 8080", "in /var/log", "modified today", "recursively",
+              "sorted by name", "with sudo", "over ssh", "in json"]
+
+
+def make_queries(count, rng):
+    return [
+        f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(QUALIFIERS)} "
+        f"{rng.randrange(100000)}"
+        for _ in range(count)
+    ]
+
+
+def stats(samples):
+    samples = sorted(samples)
+    mean = sum(samples) / len(samples)
+    return mean, samples[int(len(samples) * 0.99)]
+
+
+def bench(size, path, lookups=2000, colds=50, adds=200):
+    rng = random.Random(size)
+    # Built without syncing each add to disk; the timed adds below do sync
+    builder = QueryIndex(path, max_entries=size)
+    builder._db.execute("PRAGMA synchronous = OFF")
+    start = time.perf_counter()
+    for query in make_queries(size, rng):
+        builder.add(query, None)
+    build = time.perf_counter() - start
+
+    cold = []
+    for query in make_queries(colds, rng):
+        start = time.perf_counter()
+        QueryIndex(path, max_entries=size).lookup(query, SIMILARITY_THRESHOLD)
+        cold.append(time.perf_counter() - start)
+
+    index = QueryIndex(path, max_entries=size)
+    warm = []
+    for query in make_queries(lookups, rng):
+        start = time.perf_counter()
+        index.lookup(query, SIMILARITY_THRESHOLD)
+        warm.append(time.perf_counter() - start)
+
+    # Past max_entries, so every add also trims the oldest entry
+    added = []
+    for query in make_queries(adds, rng):
+        start = time.perf_counter()
+        index.add(query, None)
+        added.append(time.perf_counter() - start)
+
+    print(
+        f"{size:>8} entries  build {build:6.1f} s  "
+        "cold {:6.2f} ms (p99 {:6.2f})  "
+        "lookup {:6.1f} us (p99 {:6.1f})  "
+        "add {:6.2f} ms (p99 {:6.2f})".format(
+            *(value * 1e3 for value in stats(cold)),
+            *(value * 1e6 for value in stats(warm)),
+            *(value * 1e3 for value in stats(added)))
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            bench(size, os.path.join(tmp, f"index-{size}.sqlite3"))
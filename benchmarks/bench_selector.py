@@ -0,0 +1,171 @@
+"""Terminal bytes written and syscalls per keypress in the command selector.
+
+Runs the selector on a pseudo-terminal and presses Down N times before
+cancelling, once with the previous implementation (clear and reprint the
+whole list on every key, raw mode entered and left around each one-byte
+read) and once with Selector. The cost of drawing the first frame and
+cancelling is measured separately and subtracted, so the figures are per
+keypress. Syscalls counted are terminal reads and writes, select() and
+tcgetattr()/tcsetattr().
+
+Usage: python benchmarks/bench_selector.py [--keys N]
+"""
+import argparse
+import io
+import os
+import pty
+import select
+import sys
+import termios
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import groq_cli  # noqa: E402
+
+# The pty side of the benchmark must not show up in the counts
+_read, _write = os.read, os.write
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def wrap(self, func, written=False):
+        def counted(*args):
+            self.calls += 1
+            if written:
+                self.bytes += len(args[1])
+            return func(*args)
+        return counted
+
+
+class CountingRaw(io.RawIOBase):
+    # What print() writes through when stdout is a terminal
+    def __init__(self, fd, write):
+        self.fd = fd
+        self._write = write
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self._write(self.fd, bytes(data))
+
+
+def baseline(commands, fd, out, counter):
+    # The selector before the Selector class, reading from fd instead of stdin
+    stdout = io.TextIOWrapper(
+        CountingRaw(out, counter.wrap(os.write, written=True)),
+        line_buffering=True)
+    tcgetattr = counter.wrap(termios.tcgetattr)
+    tcsetattr = counter.wrap(termios.tcsetattr)
+    poll = counter.wrap(select.select)
+    read = counter.wrap(os.read)
+
+    def get_key(timeout=None):
+        old_settings = tcgetattr(fd)
+        try:
+            tty.setraw(fd)
+            if timeout is not None and not poll([fd], [], [], timeout)[0]:
+                return None
+            return read(fd, 1).decode(errors="replace")
+        finally:
+            tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+    selected = 0
+    while True:
+        print("\033[2J\033[H", end="", file=stdout)
+        print("Welcome to groq-cli. Use arrows to select or press 'c' to cancel",
+              file=stdout)
+        for idx, cmd in enumerate(commands):
+            if idx == selected:
+                print(f"\033[1;32m» {cmd['command']}\033[0m", file=stdout)
+                print(f"  \033[1;32m{cmd.get('description', '')}\033[0m",
+                      file=stdout)
+            else:
+                print(f"  {cmd['command']}", file=stdout)
+        stdout.flush()
+        key = get_key()
+        if key == "\x1b":
+            key = get_key()
+            if key == "[":
+                key = get_key()
+                if key == "B":
+                    selected = (selected + 1) % len(commands)
+        elif key == "c":
+            return None
+
+
+def current(commands, fd, out, counter):
+    real = (os.write, os.read, select.select, termios.tcgetattr,
+            termios.tcsetattr)
+    os.write = counter.wrap(os.write, written=True)
+    os.read = counter.wrap(os.read)
+    select.select = counter.wrap(select.select)
+    termios.tcgetattr = counter.wrap(termios.tcgetattr)
+    termios.tcsetattr = counter.wrap(termios.tcsetattr)
+    try:
+        groq_cli.Selector(commands, "Welcome to groq-cli", fd=fd, out_fd=out,
+                          size=(100, 40)).run()
+    finally:
+        (os.write, os.read, select.select, termios.tcgetattr,
+         termios.tcsetattr) = real
+
+
+def measure(selector, commands, presses):
+    master, slave = pty.openpty()
+    drained = threading.Event()
+
+    def drain():
+        while True:
+            try:
+                if not _read(master, 65536):
+                    break
+            except OSError:
+                break
+        drained.set()
+
+    def type_keys():
+        for _ in range(presses):
+            time.sleep(0.01)
+            _write(master, b"\x1b[B")
+        time.sleep(0.01)
+        _write(master, b"c")
+
+    threading.Thread(target=drain, daemon=True).start()
+    typist = threading.Thread(target=type_keys)
+    typist.start()
+    counter = Counter()
+    selector(commands, slave, slave, counter)
+    typist.join()
+    os.close(slave)
+    drained.wait(1)
+    os.close(master)
+    return counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=50)
+    args = parser.parse_args()
+
+    for size in (20, 200):
+        commands = [{"command": f"find /var/log -name '*.{i}.gz' -mtime +30",
+                     "description": f"Old rotated logs, generation {i}"}
+                    for i in range(size)]
+        for name, selector in (("before", baseline), ("after", current)):
+            idle = measure(selector, commands, 0)
+            pressed = measure(selector, commands, args.keys)
+            per_key_bytes = (pressed.bytes - idle.bytes) / args.keys
+            per_key_calls = (pressed.calls - idle.calls) / args.keys
+            print(f"{size:4d} commands  {name:6s}  "
+                  f"{per_key_bytes:9.0f} bytes  "
+                  f"{per_key_calls:6.1f} syscalls per keypress")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Per-query latency of one-shot invocations and of `groq-cli shell` turns.
+
+Runs a sequence of queries against a local stub of the completions endpoint,
+first as a fresh ``python`` process per query (as groq-cli runs without the
+shell) and then as turns of one Session in a single process, which keeps its
+client and connection. The stub charges a per-connection delay to stand in
+for the TCP/TLS handshake. Also reports the estimated tokens of history each
+shell turn sends on top of the system prompt.
+
+Usage: python benchmarks/bench_shell.py [--queries N] [--connect-delay S]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+ONE_SHOT = (
+    "import sys, groq_cli; "
+    "groq_cli.get_commands(sys.argv[1], use_cache=False)"
+)
+
+# Times each turn from inside one process and prints them as JSON
+SESSION = """
+import json, sys, time
+import groq_cli
+from groq_cli import CommandResult
+session = groq_cli.Session()
+samples = []
+for query in sys.argv[1:]:
+    start = time.perf_counter()
+    session.ask(query, use_cache=False)
+    samples.append({"seconds": time.perf_counter() - start,
+                    "history_tokens": session.tokens()})
+    session.add_result(query, CommandResult(0, "4.0K\\t./logs\\n" * 20, "",
+                                            0.01, 0))
+print(json.dumps(samples))
+"""
+
+
+def queries(count):
+    return [f"disk usage {idx}" if idx == 0 else f"now only for *.{idx}"
+            for idx in range(count)]
+
+
+def report(label, samples):
+    print(
+        f"{label:>9}: median {statistics.median(samples) * 1000:7.1f} ms  "
+        f"max {max(samples) * 1000:7.1f} ms  "
+        f"total {sum(samples) * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--connect-delay", type=float, default=0.05)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer(
+        delay=args.delay, connect_delay=args.connect_delay
+    ) as stub:
+        env = dict(
+            os.environ,
+            GROQ_API_KEY="stub",
+            GROQ_BASE_URL=stub.url,
+            GROQ_CLI_CACHE_DIR=tmp,
+        )
+        samples = []
+        for query in queries(args.queries):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", ONE_SHOT, query],
+                           cwd=ROOT, env=env, check=True)
+            samples.append(time.perf_counter() - start)
+        report("one-shot", samples)
+        print(f"{'':>9}  {stub.connections} connections opened")
+
+        stub.connections = 0
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", SESSION, *queries(args.queries)],
+            cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        process = time.perf_counter() - start
+        turns = json.loads(output)
+        report("shell", [turn["seconds"] for turn in turns])
+        print(f"{'':>9}  {stub.connections} connections opened, "
+              f"{process * 1000:.1f} ms for the whole process")
+        print(f"{'':>9}  history kept after each turn: "
+              + ", ".join(str(turn["history_tokens"]) for turn in turns)
+              + " estimated tokens")
+
+
+if __name__ == "__main__":
+    main()
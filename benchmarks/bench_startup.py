@@ -0,0 +1,73 @@
+"""Cold-start cost of groq_cli, suitable for tracking in CI.
+
+Reports the median cumulative import time of the module (from
+``python -X importtime``) and the median wall time of ``groq_cli.py --help``,
+and checks that the Groq SDK is not imported at startup.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--max-import-ms MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def import_time_us():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import groq_cli"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules["groq_cli"], modules
+
+
+def help_wall_time():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "groq_cli.py", "--help"],
+        cwd=ROOT, capture_output=True, check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--max-import-ms", type=float,
+        help="Exit with status 1 if the median import time exceeds this")
+    args = parser.parse_args()
+
+    imports = []
+    for _ in range(args.runs):
+        total, modules = import_time_us()
+        imports.append(total)
+    help_times = [help_wall_time() for _ in range(args.runs)]
+
+    import_ms = statistics.median(imports) / 1000
+    print(f"import groq_cli: {import_ms:.1f} ms (median of {args.runs})")
+    print(f"groq_cli.py --help: "
+          f"{statistics.median(help_times) * 1000:.1f} ms (median of {args.runs})")
+
+    status = 0
+    if "groq" in modules:
+        print("FAIL: the groq SDK is imported at startup")
+        status = 1
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: import time above {args.max_import_ms} ms")
+        status = 1
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
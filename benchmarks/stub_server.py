@@ -0,0 +1,188 @@
+"""Minimal stand-in for the Groq chat completions endpoint.
+
+Serves ``POST /openai/v1/chat/completions`` over plain HTTP/1.1 with
+keep-alive, in both the JSON and the server-sent-events (stream=True) forms.
+Point the client at it with ``GROQ_BASE_URL=<server.url>``.
+
+``connect_delay`` is paid once per new connection to stand in for the TCP and
+TLS handshake a real client performs; ``delay`` is paid on every request.
+
+Misbehaving responses are scripted with ``Reply`` objects: pass a list as
+``script`` (used in request order, then the defaults), or override
+``reply(body, index)``. A reply can be slow, stream slowly, return invalid
+content or fail with an HTTP status. Streams the client closes early are
+counted in ``cancelled``.
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = json.dumps(
+    {
+        "commands": [
+            {
+                "command": "du -sh -- */ | sort -h",
+                "description": "Disk usage per directory, smallest first.",
+                "installation": "",
+            },
+            {
+                "command": "ncdu ~",
+                "description": "Interactive disk usage browser.",
+                "installation": "sudo apt-get install ncdu",
+            },
+        ]
+    }
+)
+
+# content None uses the server's completion(); status other than 200 sends
+# an API error body instead; chunk_delay paces each streamed chunk
+Reply = namedtuple(
+    "Reply", ["content", "delay", "status", "chunk_delay"],
+    defaults=[None, 0.0, 200, 0.0])
+
+
+class StubServer:
+    def __init__(self, content=DEFAULT_CONTENT, delay=0.0, connect_delay=0.0,
+                 script=None):
+        self.content = content
+        self.delay = delay
+        self.connect_delay = connect_delay
+        self.script = list(script or [])
+        self.requests = 0
+        self.connections = 0
+        self.cancelled = 0
+        self.models = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def completion(self, body):
+        return self.content
+
+    def reply(self, body, index):
+        if index < len(self.script):
+            return self.script[index]
+        return Reply()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+                time.sleep(server.connect_delay)
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    index = server.requests
+                    server.requests += 1
+                    server.models.append(body.get("model"))
+                reply = server.reply(body, index)
+                time.sleep(server.delay + reply.delay)
+                if reply.status != 200:
+                    self._send_error(reply.status)
+                    return
+                content = reply.content
+                if content is None:
+                    content = server.completion(body)
+                if body.get("stream"):
+                    try:
+                        self._send_stream(body, content, reply.chunk_delay)
+                    except (BrokenPipeError, ConnectionResetError):
+                        with server._lock:
+                            server.cancelled += 1
+                else:
+                    self._send_json(body, content)
+
+            def _send_error(self, status):
+                payload = json.dumps({"error": {
+                    "message": "stub failure", "type": "server_error"}}
+                ).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_json(self, body, content):
+                payload = json.dumps(
+                    {
+                        "id": "stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "stub"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {
+                                    "role": "assistant",
+                                    "content": content,
+                                },
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": 100,
+                            "completion_tokens": len(content) // 4,
+                            "total_tokens": 100 + len(content) // 4,
+                        },
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_stream(self, body, content, chunk_delay=0.0):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for start in range(0, len(content), 16):
+                    chunk = {
+                        "id": "stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "stub"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": {"content": content[start:start + 16]},
+                                "finish_reason": None,
+                            }
+                        ],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
@@ -1,32 +1,135 @@
 import argparse
+import codecs
+import contextlib
 import os
 import json
+import operator
 import sys
 import termios
 import tty
 import subprocess
-from groq import Groq
-from dotenv import load_dotenv
+import functools
+import getpass
 import re
+import select
+import selectors
+import signal
+import socket
+import socketserver
+import stat
+import hashlib
+import math
+import queue
+import random
+import shlex
+import shutil
+from collections import namedtuple
+import sqlite3
+from array import array
+import threading
+import time
 
-# Load environment variables from .env file
-load_dotenv()
 
-# Load API key from environment variable for better security
-API_KEY = os.getenv("GROQ_API_KEY")
-if not API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable not set")
+def _process_started():
+    # The time.perf_counter() reading at which this process started, so
+    # "startup" includes the interpreter and the imports above. Read from
+    # /proc on Linux (10 ms resolution); elsewhere it is now.
+    now = time.perf_counter()
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesized program name, from the 3rd on
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return now
+    return now - max(age, 0.0)
+
+
+_PROCESS_STARTED = _process_started()
+
+MODEL = "llama-3.1-70b-versatile"
+
+# Simple requests go to the fast small model and everything else, or an
+# answer from the small model that fails validation, to the large one
+MODELS = {
+    "small": os.getenv("GROQ_CLI_SMALL_MODEL", "llama-3.1-8b-instant"),
+    "large": os.getenv("GROQ_CLI_LARGE_MODEL", MODEL),
+}
+ROUTING = os.getenv("GROQ_CLI_ROUTING", "1") != "0"
+ROUTE_THRESHOLD = float(os.getenv("GROQ_CLI_ROUTE_THRESHOLD", "1.0"))
+
+# Hedged requests: if no valid answer arrives within `delay` seconds, a
+# second request to `model` (default: the large model) races the first.
+# GROQ_CLI_HEDGE sets the delay and turns hedging on.
+HedgePolicy = namedtuple("HedgePolicy", ["delay", "model"])
+HEDGE = (
+    HedgePolicy(float(os.environ["GROQ_CLI_HEDGE"]),
+                os.getenv("GROQ_CLI_HEDGE_MODEL"))
+    if os.getenv("GROQ_CLI_HEDGE") else None
+)
+
+# Describe this machine to the model so it answers for it alone
+HOST_CONTEXT = os.getenv("GROQ_CLI_HOST_CONTEXT", "1") != "0"
+PACKAGE_MANAGERS = ["apt-get", "dnf", "yum", "pacman", "zypper", "apk", "brew"]
+HOST_TOOLS = [
+    "curl", "wget", "git", "rsync", "ssh", "jq", "python3", "pip3", "docker",
+    "podman", "kubectl", "systemctl", "journalctl", "ss", "netstat", "ip",
+    "ifconfig", "lsof", "nmap", "iptables", "ufw", "firewall-cmd", "htop",
+    "ncdu", "iostat", "iperf3", "speedtest-cli", "zip", "unzip", "tree",
+]
+
+# Local log of timings, token counts and cache outcomes for `groq-cli stats`
+TELEMETRY = os.getenv("GROQ_CLI_TELEMETRY", "1") != "0"
+
+# Seconds between checks of the $PATH directories for installed programs
+PATH_INDEX_RECHECK = 2.0
+
+# Seconds between checks of whether the host description is out of date
+HOST_RECHECK = 2.0
+
+# Response cache limits, overridable from the environment
+CACHE_MAX_ENTRIES = int(os.getenv("GROQ_CLI_CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL = int(os.getenv("GROQ_CLI_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Minimum similarity for answering a query from a near-duplicate earlier one
+SIMILARITY_THRESHOLD = float(os.getenv("GROQ_CLI_SIMILARITY", "0.75"))
+INDEX_MAX_ENTRIES = int(os.getenv("GROQ_CLI_INDEX_MAX_ENTRIES", "50000"))
+
+# Extra attempts, with jittered exponential backoff, after a 429 or 5xx
+# response or a failed connection
+RATE_LIMIT_RETRIES = int(os.getenv("GROQ_CLI_RATE_LIMIT_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Idle keep-alive connections are kept this long, so a resident daemon can
+# reuse one TLS connection across queries
+KEEPALIVE_EXPIRY = float(os.getenv("GROQ_CLI_KEEPALIVE_EXPIRY", "120"))
+DAEMON_TIMEOUT = 120
+# Seconds to connect to the daemon, and to wait for it to answer a ping
+DAEMON_CONNECT_TIMEOUT = 1.0
+
+# Bytes of each output stream kept from an executed command for error analysis
+OUTPUT_TAIL_BYTES = int(os.getenv("GROQ_CLI_OUTPUT_TAIL_BYTES", "65536"))
+OUTPUT_CHUNK_BYTES = 65536
+
+# Characters of a failed command's output sent to the API for analysis
+ERROR_CONTEXT_CHARS = 2000
 
-client = Groq(api_key=API_KEY)
+# Conversation kept by `groq-cli shell`: estimated tokens of earlier turns
+# sent with each request, and characters of a command's output fed back
+SESSION_HISTORY_TOKENS = int(os.getenv("GROQ_CLI_SESSION_TOKENS", "2000"))
+SESSION_OUTPUT_CHARS = 1000
 
+# Commands run at once when several are selected
+PARALLEL_JOBS = int(os.getenv("GROQ_CLI_JOBS", "4"))
 
-def get_commands(query):
-    completion = client.chat.completions.create(
-        model="llama-3.1-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """
+# Limits on the loop that runs suggested fixes for a failed command
+MAX_REPAIR_ATTEMPTS = int(os.getenv("GROQ_CLI_MAX_REPAIRS", "3"))
+REPAIR_TIME_BUDGET = float(os.getenv("GROQ_CLI_REPAIR_SECONDS", "600"))
+REPAIR_TOKEN_BUDGET = int(os.getenv("GROQ_CLI_REPAIR_TOKENS", "8000"))
+
+COMMANDS_SYSTEM_PROMPT = """
                 You are an expert Linux command-line interface (CLI) master, capable of providing the most appropriate and efficient commands for any operation across various Linux distributions and tools. Your expertise covers a wide range of domains including but not limited to:
 
                     1. File and directory operations (e.g., ls, cp, mv, rm, mkdir, find, grep)
@@ -89,65 +192,9 @@ def get_commands(query):
                         }
                     ]
                 }
-                """,
-            },
-            {"role": "user", "content": query},
-        ],
-        temperature=0.2,
-        max_tokens=1000,
-        top_p=1,
-        stream=False,
-        stop=None,
-    )
-
-    try:
-        # First, try to parse the response as-is
-        data = json.loads(completion.choices[0].message.content.strip())
-    except json.JSONDecodeError:
-        # If parsing fails, attempt to fix common issues
-        content = completion.choices[0].message.content.strip()
-
-        # Replace unescaped backslashes with escaped ones
-        content = re.sub(r'(?<!\\)\\(?![\\"{}])', r"\\\\", content)
-
-        # Remove any text outside of the JSON object
-        content = re.search(r"\{.*\}", content, re.DOTALL)
-        if content:
-            content = content.group(0)
-        else:
-            raise ValueError("No valid JSON object found in the response")
-
-        # Try parsing the cleaned content
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
-            print("Raw content:")
-            print(content)
-            raise ValueError("Failed to parse the response as JSON")
-
-    # Validate the structure of the parsed data
-    if (
-        not isinstance(data, dict)
-        or "commands" not in data
-        or not isinstance(data["commands"], list)
-    ):
-        raise ValueError("Invalid response structure")
-
-    for cmd in data["commands"]:
-        if not isinstance(cmd, dict) or "command" not in cmd:
-            raise ValueError("Invalid command structure in response")
+                """
 
-    return data
-
-
-def handle_error(error_message):
-    completion = client.chat.completions.create(
-        model="llama-3.1-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """
+ERROR_SYSTEM_PROMPT = """
                 You are an expert Linux troubleshooter, specialized in diagnosing and resolving command-line errors. Your task is to analyze the error message provided, identify the root cause, and suggest appropriate solutions. Your expertise covers:
 
                 1. Command not found errors
@@ -195,170 +242,3306 @@ def handle_error(error_message):
                         }
                     ]
                 }
-                """,
-            },
-            {"role": "user", "content": f"Error message: {error_message}"},
-        ],
-        temperature=0.2,
-        max_tokens=1000,
-        top_p=1,
-        stream=False,
-        stop=None,
+                """
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    # The SDK and its httpx/pydantic stack are imported on first use so that
+    # --help, cache hits and subcommands that never call the API start fast.
+    started = time.perf_counter()
+    import httpx
+    from dotenv import load_dotenv
+    from groq import DefaultHttpxClient, Groq
+
+    # Load environment variables from .env file
+    load_dotenv()
+
+    # Load API key from environment variable for better security
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY environment variable not set")
+
+    limits = httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
     )
+    # Retries are left to _create_completion so there is a single policy
+    client = Groq(
+        api_key=api_key,
+        http_client=DefaultHttpxClient(limits=limits),
+        max_retries=0,
+    )
+    telemetry().add_time("client", time.perf_counter() - started)
+    return client
+
 
+def _retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    from groq import APIConnectionError
+    return isinstance(error, APIConnectionError)
+
+
+def _retry_delay(error, attempt):
+    # Honour Retry-After when the API sends it, else back off exponentially
+    response = getattr(error, "response", None)
+    retry_after = None
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
     try:
-        data = json.loads(completion.choices[0].message.content.strip())
-    except json.JSONDecodeError:
-        raise ValueError("Failed to parse the error handling response as JSON")
+        return min(float(retry_after), BACKOFF_MAX)
+    except (TypeError, ValueError):
+        delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+        return delay / 2 + random.uniform(0, delay / 2)
 
-    if (
-        not isinstance(data, dict)
-        or "explanation" not in data
-        or "solutions" not in data
-    ):
-        raise ValueError("Invalid error handling response structure")
 
-    return data
+class Telemetry:
+    # Timings, counters and API calls of one invocation. recording() appends
+    # it to telemetry.jsonl in the cache directory as a single JSON line,
+    # which `groq-cli stats` aggregates. Nothing is sent anywhere.
+    def __init__(self, command):
+        self.command = command
+        self.started = time.time()
+        self.timings = {}
+        self.counters = {}
+        self.calls = []
+        self.routes = []
+        self._lock = threading.Lock()
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_call(self, model, latency, usage=None, first_token=None):
+        call = {"model": model, "latency": round(latency, 4)}
+        if first_token is not None:
+            call["first_token"] = round(first_token, 4)
+            self.add_time("first_token", first_token)
+        call.update(usage or {})
+        with self._lock:
+            self.calls.append(call)
+        self.add_time("network", latency)
+
+    def add_route(self, kind, decision, route, escalated):
+        with self._lock:
+            self.routes.append({
+                "kind": kind, "route": route, "score": decision["score"],
+                "classified": decision["route"], "escalated": escalated})
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "time": round(self.started, 3),
+                "command": self.command,
+                "timings": {k: round(v, 4) for k, v in self.timings.items()},
+                "counters": dict(self.counters),
+                "calls": list(self.calls),
+                "routes": list(self.routes),
+            }
+
+    def write(self, path=None):
+        if not TELEMETRY:
+            return
+        path = path or telemetry_path()
+        try:
+            # One write per record, so concurrent appenders don't interleave
+            with open(path, "a") as f:
+                f.write(json.dumps(self.to_dict()) + "\n")
+        except OSError:
+            pass
+
+
+class _NullTelemetry(Telemetry):
+    # Receives measurements made outside any recording()
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def add_call(self, model, latency, usage=None, first_token=None):
+        pass
+
+    def add_route(self, kind, decision, route, escalated):
+        pass
+
+
+_NO_TELEMETRY = _NullTelemetry(None)
+_telemetry_local = threading.local()
+_telemetry_process = None
+
+
+def telemetry():
+    # The record of the recording() active in this thread, else the one of
+    # the whole process, so worker threads report to their invocation
+    record = getattr(_telemetry_local, "record", None) or _telemetry_process
+    return _NO_TELEMETRY if record is None else record
 
 
-def get_key():
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
+@contextlib.contextmanager
+def recording(command, thread_only=False):
+    # Collects telemetry for the enclosed code and appends it to the log at
+    # the end. The daemon records each request with thread_only, since its
+    # requests run concurrently in one process.
+    global _telemetry_process
+    record = Telemetry(command)
+    if thread_only:
+        previous = getattr(_telemetry_local, "record", None)
+        _telemetry_local.record = record
+    else:
+        previous, _telemetry_process = _telemetry_process, record
     try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
+        yield record
     finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
+        if thread_only:
+            _telemetry_local.record = previous
+        else:
+            _telemetry_process = previous
+        record.write()
 
 
-def display_and_select_command(commands):
-    selected = 0
-    while True:
-        print("\033[2J\033[H", end="")  # Clear screen
-        print("Welcome to groq-cli. Use arrows to select or press 'c' to cancel")
-        for idx, cmd in enumerate(commands):
-            if idx == selected:
-                print(f"\033[1;32m» {cmd['command']}\033[0m")
-                print(f"  \033[1;32m{cmd['description']}\033[0m")
-            else:
-                print(f"  {cmd['command']}")
-
-        key = get_key()
-        if key == "\x1b":
-            key = get_key()
-            if key == "[":
-                key = get_key()
-                if key == "A":  # Up arrow
-                    selected = (selected - 1) % len(commands)
-                elif key == "B":  # Down arrow
-                    selected = (selected + 1) % len(commands)
-        elif key == "c":  # Cancel
-            return None
-        elif key == "\r":  # Enter key
-            return commands[selected]
+def telemetry_path():
+    return os.path.join(cache_dir(), "telemetry.jsonl")
 
 
-def display_and_select_solution(solutions):
-    selected = 0
+def _create_completion(messages, stream=False, model=MODELS["large"]):
+    # Calls are recorded in telemetry here; streamed ones by their consumer
+    attempt = 0
     while True:
-        print("\033[2J\033[H", end="")  # Clear screen
-        print("Use arrows to select a solution or press 'c' to cancel")
-        for idx, solution in enumerate(solutions):
-            if idx == selected:
-                print(f"\033[1;32m» {solution['command']}\033[0m")
-                print(f"  \033[1;32m{solution['description']}\033[0m")
+        client = get_client()
+        start = time.perf_counter()
+        try:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                max_tokens=1000,
+                top_p=1,
+                stream=stream,
+                stop=None,
+            )
+        except Exception as e:
+            if not _retryable(e) or attempt >= RATE_LIMIT_RETRIES:
+                raise
+            telemetry().count(
+                "rate_limited" if getattr(e, "status_code", None) == 429
+                else "retried")
+            time.sleep(_retry_delay(e, attempt))
+            attempt += 1
+            continue
+        if not stream:
+            telemetry().add_call(
+                model, time.perf_counter() - start, _usage_of(completion))
+        return completion
+
+
+# Wording that signals a multi-step request, and tools that are easy to get
+# wrong; either sends a request to the large model
+_MULTI_STEP = re.compile(
+    r"\b(?:then|after(?:wards)?|before|each|every|for all|loop|script|"
+    r"unless|except|if|when|while|until|schedule\w*|cron\w*|"
+    r"recursive(?:ly)?|automat\w*|compare|combine|both)\b"
+)
+_COMPLEX_DOMAINS = re.compile(
+    r"\b(?:kubernetes|kubectl|k8s|helm|terraform|ansible|iptables|"
+    r"nftables|selinux|apparmor|lvm|raid|mdadm|luks|cryptsetup|openssl|"
+    r"certificates?|tls|ssl|vpn|wireguard|tunnel\w*|compose|awk|sed|"
+    r"regex\w*|rebase|bisect|cgroups?|ebpf|strace|traceback|segfault|"
+    r"segmentation)\b"
+)
+
+
+def classify_request(text):
+    # Cheap local features deciding which model answers: long or multi-line
+    # text, multi-step wording and tricky tool domains add to the score, and
+    # ROUTE_THRESHOLD or more goes to the large model
+    lowered = text.lower()
+    words = len(lowered.split())
+    lines = lowered.count("\n") + 1
+    steps = _MULTI_STEP.findall(lowered)
+    domains = _COMPLEX_DOMAINS.findall(lowered)
+    score = (max(0, words - 8) / 8 + max(0, lines - 4) / 4
+             + 0.5 * len(steps) + len(domains))
+    return {
+        "route": "large" if score >= ROUTE_THRESHOLD else "small",
+        "score": round(score, 2),
+        "words": words,
+        "lines": lines,
+        "steps": steps,
+        "domains": domains,
+    }
+
+
+def _routed_completion(kind, text, messages, parse):
+    # Asks the model the classifier picks and returns the parsed content of
+    # its answer and the token usage. Anything the small model gets wrong,
+    # including output that fails validation, is asked again of the large
+    # model.
+    decision = classify_request(text)
+    route = decision["route"] if ROUTING else "large"
+    escalated = False
+    try:
+        while True:
+            try:
+                completion = _create_completion(messages, model=MODELS[route])
+                with telemetry().timed("parse"):
+                    data = parse(completion.choices[0].message.content)
+                return data, _usage_of(completion)
+            except Exception:
+                if route == "large":
+                    raise
+                route, escalated = "large", True
+    finally:
+        telemetry().add_route(kind, decision, route, escalated)
+
+
+class _HedgeAttempt:
+    # One streamed request in a hedged race. Its outcome is put on `results`
+    # as (attempt, data, usage, error); cancel() closes the stream, which
+    # drops the connection so the server stops generating.
+    def __init__(self, model, messages, parse, results, record):
+        self.model = model
+        self.messages = messages
+        self.parse = parse
+        self.results = results
+        self.record = record
+        self.cancelled = threading.Event()
+        self._stream = None
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        self.cancelled.set()
+        stream = self._stream
+        if stream is not None:
+            stream.close()
+
+    def _run(self):
+        _telemetry_local.record = self.record
+        started = time.perf_counter()
+        first_token = None
+        usage = None
+        parts = []
+        try:
+            self._stream = _create_completion(
+                self.messages, stream=True, model=self.model)
+            if self.cancelled.is_set():
+                self._stream.close()
+            for chunk in self._stream:
+                usage = _usage_of(getattr(chunk, "x_groq", None)) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    parts.append(chunk.choices[0].delta.content)
+            data = self.parse("".join(parts))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.results.put((self, None, None, e))
+            return
+        finally:
+            if self.cancelled.is_set():
+                self.record.count("hedge.cancelled")
             else:
-                print(f"  {solution['command']}")
-
-        key = get_key()
-        if key == "\x1b":
-            key = get_key()
-            if key == "[":
-                key = get_key()
-                if key == "A":  # Up arrow
-                    selected = (selected - 1) % len(solutions)
-                elif key == "B":  # Down arrow
-                    selected = (selected + 1) % len(solutions)
-        elif key == "c":  # Cancel
-            return None
-        elif key == "\r":  # Enter key
-            return solutions[selected]
+                self.record.add_call(
+                    self.model, time.perf_counter() - started, usage,
+                    first_token)
+        if not self.cancelled.is_set():
+            self.results.put((self, data, usage, None))
+
+
+def _hedged_completion(kind, text, messages, parse, hedge):
+    # Like _routed_completion, but when the routed request has not returned
+    # an answer that parses within hedge.delay seconds, or fails before
+    # that, a second request to hedge.model (default: the large model)
+    # races it. The first valid answer wins and the other is cancelled.
+    decision = classify_request(text)
+    route = decision["route"] if ROUTING else "large"
+    models = [MODELS[route], hedge.model or MODELS["large"]]
+    get_client()  # built once here rather than by both attempts
+    record = telemetry()
+    results = queue.Queue()
+    attempts = [_HedgeAttempt(models[0], messages, parse, results, record)]
+    deadline = time.monotonic() + hedge.delay
+    failures = 0
+    winner = None
+    try:
+        while True:
+            timeout = None
+            if len(attempts) == 1:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                attempt, data, usage, error = results.get(timeout=timeout)
+            except queue.Empty:
+                attempt = error = None
+            if attempt is not None and error is None:
+                winner = attempts.index(attempt)
+                return data, usage
+            if attempt is not None:
+                failures += 1
+                if failures == 2:
+                    raise error
+            if len(attempts) == 1:
+                record.count("hedge.fired")
+                attempts.append(
+                    _HedgeAttempt(models[1], messages, parse, results, record))
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+        if winner == 1:
+            record.count("hedge.won")
+        record.add_route(
+            kind, decision, "hedge" if winner == 1 else route, winner == 1)
+
+
+def _host_probe_key():
+    # Changes whenever the probe could give a different answer: tools
+    # installed or removed (PATH directory mtimes), a new shell or user, or
+    # a distribution upgrade
+    parts = [os.getenv("PATH", ""), os.getenv("SHELL", ""), str(os.geteuid())]
+    paths = ["/etc/os-release"] + os.getenv("PATH", "").split(os.pathsep)
+    for path in paths:
+        try:
+            parts.append(f"{path}:{os.stat(path).st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path}:-")
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def probe_host():
+    release = {}
+    try:
+        with open("/etc/os-release") as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep:
+                    release[key] = value.strip('"')
+    except OSError:
+        pass
+    tools = [tool for tool in HOST_TOOLS if shutil.which(tool)]
+    return {
+        "os": release.get("PRETTY_NAME") or sys.platform,
+        "id": release.get("ID", ""),
+        "like": release.get("ID_LIKE", ""),
+        "package_manager": next(
+            (pm for pm in PACKAGE_MANAGERS if shutil.which(pm)), None),
+        "shell": os.path.basename(os.getenv("SHELL", "")) or "sh",
+        "root": os.geteuid() == 0,
+        "sudo": shutil.which("sudo") is not None,
+        "tools": tools,
+        "missing": [tool for tool in HOST_TOOLS if tool not in tools],
+    }
+
+
+_host_infos = {}
+
+
+def get_host_info():
+    # Probed once and kept in the cache directory until the probe key
+    # changes. The key is rechecked at most every HOST_RECHECK seconds, so
+    # the daemon and the shell notice programs installed while they run.
+    path = os.path.join(cache_dir(), "host.json")
+    with _caches_lock:
+        now = time.monotonic()
+        entry = _host_infos.get(path)
+        if entry is not None and now - entry[0] < HOST_RECHECK:
+            return entry[2]
+        key = _host_probe_key()
+        if entry is not None and entry[1] == key:
+            host = entry[2]
+        else:
+            host = _load_host_info(path, key)
+        _host_infos[path] = (now, key, host)
+        return host
+
+
+def _load_host_info(path, key):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return cached["host"]
+    except (OSError, ValueError):
+        pass
+    host = probe_host()
+    try:
+        with open(path, "w") as f:
+            json.dump({"key": key, "host": host}, f)
+    except OSError:
+        pass  # probed again next time
+    return host
+
+
+def host_context():
+    if not HOST_CONTEXT:
+        return ""
+    host = get_host_info()
+    if host["root"]:
+        user = "running as root"
+    elif host["sudo"]:
+        user = "non-root user with sudo"
+    else:
+        user = "non-root user without sudo"
+    return (
+        f"Target machine: {host['os']}; package manager: "
+        f"{host['package_manager'] or 'unknown'}; shell: {host['shell']}; "
+        f"{user}; installed: {', '.join(host['tools']) or 'none'}; "
+        f"not installed: {', '.join(host['missing']) or 'none'}. "
+        "Answer for this machine only: no variants for other distributions "
+        "or package managers, and installation commands only for tools that "
+        "are not installed."
+    )
+
+
+def _system_messages(prompt):
+    messages = [{"role": "system", "content": prompt}]
+    context = host_context()
+    if context:
+        messages.append({"role": "system", "content": context})
+    return messages
+
 
+def _prompt_id(prompt):
+    # What the cache keys on: the system prompt and the host description
+    return prompt + "\n" + host_context()
 
-def execute_command(command):
-    print(f"\nExecuting: {command}")
+
+def _command_messages(query):
+    return _system_messages(COMMANDS_SYSTEM_PROMPT) + [
+        {"role": "user", "content": query},
+    ]
+
+
+class PathIndex:
+    # Executable names in each $PATH directory, persisted to a JSON file.
+    # refresh() stats every directory and rescans only those whose mtime
+    # changed since they were last listed, so lookups are set membership.
+    def __init__(self, path):
+        self.path = path
+        self.dirs = {}
+        self.names = frozenset()
+        self.checked = 0.0
+        self._state = None
+        try:
+            with open(path) as f:
+                self.dirs = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _scan(directory):
+        names = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and os.access(entry.path, os.X_OK):
+                            names.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return names
+
+    def refresh(self, search_path=None):
+        search_path = os.getenv("PATH", "") if search_path is None else search_path
+        directories = [d for d in dict.fromkeys(search_path.split(os.pathsep)) if d]
+        changed = False
+        state = []
+        for directory in directories:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            entry = self.dirs.get(directory)
+            if entry is None or entry["mtime"] != mtime:
+                self.dirs[directory] = {
+                    "mtime": mtime, "names": self._scan(directory)}
+                changed = True
+            state.append((directory, mtime))
+        if state != self._state:
+            self._state = state
+            self.names = frozenset(
+                name for directory, _ in state
+                for name in self.dirs[directory]["names"])
+        self.checked = time.monotonic()
+        if changed:
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.dirs, f)
+            os.replace(tmp, self.path)
+        return self
+
+    def __contains__(self, name):
+        if "/" in name:
+            path = os.path.expanduser(name)
+            return os.path.isfile(path) and os.access(path, os.X_OK)
+        return name in self.names
+
+
+_path_indexes = {}
+
+
+def get_path_index():
+    # Directory mtimes are rechecked at most every PATH_INDEX_RECHECK seconds
+    path = os.path.join(cache_dir(), "path_index.json")
+    with _caches_lock:
+        index = _path_indexes.get(path)
+        if index is None:
+            index = _path_indexes[path] = PathIndex(path)
+        if time.monotonic() - index.checked >= PATH_INDEX_RECHECK:
+            index.refresh()
+        return index
+
+
+_SHELL_BUILTINS = frozenset(
+    ". : [ [[ ]] alias bg break cd command continue declare echo eval exec "
+    "exit export false fg getopts hash help history jobs kill let local "
+    "popd printf pushd pwd read readonly return set shift source test times "
+    "trap true type typeset ulimit umask unalias unset wait".split()
+)
+# Keywords followed by the command they apply to
+_SHELL_PREFIX_KEYWORDS = frozenset("! { do elif else if then time until while".split())
+# Keywords whose segment contains no command to run
+_SHELL_SKIP_KEYWORDS = frozenset("} case done esac fi for function in select".split())
+# Commands that run the command after them, with their options that take a value
+_COMMAND_WRAPPERS = {
+    "sudo": {"-C", "-D", "-g", "-h", "-p", "-r", "-t", "-U", "-u"},
+    "env": {"-C", "-S", "-u"},
+    "nice": {"-n"},
+    "nohup": set(),
+    "stdbuf": set(),
+    "timeout": {"-k", "-s"},
+    "command": set(),
+    "exec": set(),
+}
+_ASSIGNMENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*\+?=")
+# Shell words and operators in one pass; an unbalanced quote or trailing
+# backslash matches "bad"
+_SHELL_TOKEN = re.compile(
+    r"""(?P<op>[();<>|&]+)"""
+    r"""|(?P<word>(?:[^\s'"\\();<>|&]+|'[^']*'|"(?:[^"\\]|\\.)*"|\\.)+)"""
+    r"""|(?P<bad>['"\\])""",
+    re.S,
+)
+
+
+def _shell_tokens(command):
+    # Same tokens as shlex with punctuation_chars, at a fraction of the cost
+    for op, word, bad in _SHELL_TOKEN.findall(command):
+        if bad:
+            raise ValueError(f"unbalanced {bad} in command")
+        if op:
+            yield True, op
+        elif "'" in word or '"' in word or "\\" in word:
+            yield False, shlex.split(word)[0]
+        else:
+            yield False, word
+
+
+def command_binaries(command):
+    # Programs a shell command line runs, including each stage of pipelines
+    # and &&/||/; chains. Builtins, keywords and assignments are skipped;
+    # wrappers like sudo count along with the command they run.
     try:
-        # Use bash to execute the command, which allows for proper expansion of
-        # {1..10}
-        result = subprocess.run(
-            ["bash", "-c", command], check=True, text=True, capture_output=True
+        tokens = list(_shell_tokens(command))
+    except ValueError:
+        return []
+    binaries = []
+    expect_command = True
+    wrapper = None
+    skip = 0
+    for operator_, token in tokens:
+        if operator_:
+            # Redirections take the next word; anything else starts a command
+            if "<" in token or ">" in token:
+                skip = 1
+            else:
+                expect_command, wrapper, skip = True, None, 0
+            continue
+        if skip:
+            skip -= 1
+            continue
+        if wrapper is not None:
+            if token in _COMMAND_WRAPPERS[wrapper]:
+                skip = 1
+                continue
+            if token.startswith("-") or (wrapper == "env" and "=" in token):
+                continue
+            if wrapper == "timeout":
+                wrapper = None
+                continue  # the duration
+            wrapper = None
+        if not expect_command:
+            continue
+        if token in _SHELL_PREFIX_KEYWORDS or _ASSIGNMENT.match(token):
+            continue
+        if token in _SHELL_SKIP_KEYWORDS:
+            expect_command = False
+            continue
+        if token in _COMMAND_WRAPPERS:
+            wrapper = token
+            if token not in _SHELL_BUILTINS and token not in binaries:
+                binaries.append(token)
+            continue
+        expect_command = False
+        if token in _SHELL_BUILTINS or token.startswith(("$", "`", "~")):
+            continue
+        if token not in binaries:
+            binaries.append(token)
+    return binaries
+
+
+def missing_binaries(command, index=None):
+    index = get_path_index() if index is None else index
+    return [name for name in command_binaries(command) if name not in index]
+
+
+def rank_by_availability(commands):
+    # Stable sort: commands whose programs are all installed come first
+    index = get_path_index()
+    return sorted(
+        commands, key=lambda cmd: bool(missing_binaries(cmd["command"], index)))
+
+
+def cache_dir():
+    path = os.getenv("GROQ_CLI_CACHE_DIR") or os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "groq-cli")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+
+def _models_id():
+    # The models a response can come from with the current configuration
+    if not ROUTING:
+        return MODELS["large"]
+    return ",".join(f"{name}={MODELS[name]}" for name in sorted(MODELS))
+
+
+def cache_key(kind, text, system_prompt, model=None):
+    model = model or _models_id()
+    prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+    key = "\0".join([kind, model, prompt_hash, normalize_query(text)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResponseCache:
+    # SQLite-backed store of validated API responses with per-entry TTL,
+    # LRU eviction above max_entries and per-kind hit/miss counters.
+    def __init__(self, path, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                accessed REAL NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS stats (
+                kind TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+            """
         )
-        print(result.stdout)
+
+    def _count(self, kind, column):
+        telemetry().count(f"cache.{kind}.{column}")
+        self._db.execute(
+            "INSERT OR IGNORE INTO stats (kind) VALUES (?)", (kind,))
+        self._db.execute(
+            f"UPDATE stats SET {column} = {column} + 1 WHERE kind = ?", (kind,))
+
+    def record(self, kind, hit):
+        with self._lock:
+            self._count(kind, "hits" if hit else "misses")
+
+    def get(self, kind, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self._count(kind, "misses")
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._count(kind, "hits")
+        return json.loads(row[0])
+
+    def put(self, kind, key, value, ttl=None):
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(value), now, expires),
+            )
+            self._db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+            # Evict the least recently used entries above the size cap
+            self._db.execute(
+                """
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY accessed DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            counts = dict(
+                self._db.execute(
+                    "SELECT kind, COUNT(*) FROM entries GROUP BY kind"))
+            rows = self._db.execute(
+                "SELECT kind, hits, misses FROM stats ORDER BY kind").fetchall()
+        return {
+            kind: {"hits": hits, "misses": misses,
+                   "entries": counts.get(kind, 0)}
+            for kind, hits, misses in rows
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM stats")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache():
+    path = os.path.join(cache_dir(), "cache.sqlite3")
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResponseCache(path)
+        return _caches[path]
+
+
+_STOPWORDS = frozenset(
+    "a all an and any are by can do each every for from get give how i in "
+    "is it list me my of on per please show that the this to using what "
+    "which with".split()
+)
+
+_SYNONYMS = {
+    "folder": "directory",
+    "folders": "directory",
+    "dir": "directory",
+    "dirs": "directory",
+    "directories": "directory",
+    "files": "file",
+    "ports": "port",
+    "processes": "process",
+    "procs": "process",
+    "size": "usage",
+    "space": "usage",
+}
+
+# Verbs that change what a query asks for. Near-duplicates must have the same
+# set of these, so "delete old logs" never answers "list old logs"; read-only
+# wording (show, list, find, count, ...) has none.
+_ACTION_VERBS = {
+    "delete": "delete remove rm erase purge wipe clean clear shred",
+    "stop": "kill stop terminate",
+    "start": "start launch",
+    "restart": "restart reload",
+    "install": "install",
+    "uninstall": "uninstall",
+    "create": "create make mkdir touch",
+    "move": "move rename mv",
+    "copy": "copy cp duplicate backup",
+    "compress": "compress zip archive",
+    "extract": "extract unzip unpack decompress",
+    "change": "change modify edit set update replace",
+    "enable": "enable",
+    "disable": "disable",
+    "mount": "mount",
+    "unmount": "unmount umount",
+    "download": "download",
+    "upload": "upload push",
+}
+
+
+def _inflections(verb):
+    stem = verb[:-1] if verb.endswith("e") else verb
+    return {verb, verb + "s", verb + "es", verb + "d", stem + "ed",
+            stem + "ing", verb + verb[-1] + "ed", verb + verb[-1] + "ing"}
+
+
+_ACTIONS = {
+    form: action
+    for action, verbs in _ACTION_VERBS.items()
+    for verb in verbs.split()
+    for form in _inflections(verb)
+}
+
+# Programs whose suggestions are never reused for a merely similar query
+_DESTRUCTIVE_PROGRAMS = frozenset(
+    "rm rmdir shred dd kill killall pkill truncate wipefs fdisk parted".split())
+
+# 32 minhash values of 16 bits each, taken from one 64-byte blake2b digest
+# per shingle, grouped into 8 LSH bands of 4 rows
+_MINHASH_BANDS = 8
+_MINHASH_ROWS = 4
+_MINHASH_CANDIDATES = 16
+
+
+def _stem(word):
+    for suffix in ("ing", "es", "ed", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def query_shingles(query):
+    # Canonical words plus adjacent word pairs
+    words = []
+    for word in re.findall(r"[\w.*/-]+", query.lower()):
+        word = _SYNONYMS.get(word, word)
+        if word not in _STOPWORDS:
+            words.append(_stem(word))
+    shingles = set(words)
+    shingles.update(" ".join(pair) for pair in zip(words, words[1:]))
+    return shingles
+
+
+def query_actions(query):
+    return frozenset(
+        _ACTIONS[word] for word in re.findall(r"[\w.*/-]+", query.lower())
+        if word in _ACTIONS)
+
+
+def is_destructive(command):
+    # Deletes, kills or overwrites something, anywhere in the command line
+    try:
+        for is_op, token in _shell_tokens(command):
+            name = os.path.basename(token)
+            if not is_op and (name in _DESTRUCTIVE_PROGRAMS
+                              or name.startswith("mkfs") or token == "-delete"):
+                return True
+    except ValueError:
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing command: {e}")
-        print(f"Exit code: {e.returncode}")
-        if e.stdout:
-            print("Standard output:")
-            print(e.stdout)
-        if e.stderr:
-            print("Standard error:")
-            print(e.stderr)
-
-        # Handle the error
-        error_data = handle_error(str(e))
-        print("\nError Analysis:")
-        print(error_data["explanation"])
-        print("\nSuggested Solutions:")
-        for idx, solution in enumerate(error_data["solutions"], 1):
-            print(f"{idx}. {solution['description']}")
-
-        # Allow the user to select and execute a solution using arrow keys
-        selected_solution = display_and_select_solution(
-            error_data["solutions"])
-        if selected_solution:
-            execute_command(selected_solution["command"])
-        else:
-            print("No solution selected. Command execution cancelled.")
-    except FileNotFoundError:
-        print(
-            f"Error: Command '{command.split()[0]}' not found. Please check if it's installed and in your PATH."
+    return False
+
+
+def minhash_signature(query):
+    digests = [
+        array("H", hashlib.blake2b(shingle.encode(), digest_size=64).digest())
+        for shingle in query_shingles(query)
+    ]
+    if not digests:
+        return None
+    if len(digests) == 1:
+        return digests[0]
+    return array("H", map(min, *digests))
+
+
+def _signature(blob):
+    signature = array("H")
+    signature.frombytes(blob)
+    return signature
+
+
+def _band_keys(signature):
+    # One signed 64-bit key per LSH band, as stored in query_bands
+    return [
+        (band, int.from_bytes(
+            signature[band * _MINHASH_ROWS:(band + 1) * _MINHASH_ROWS].tobytes(),
+            "little", signed=True))
+        for band in range(_MINHASH_BANDS)
+    ]
+
+
+class QueryIndex:
+    # MinHash/LSH index over previously validated get_commands results.
+    # Each entry's LSH band keys are rows of an indexed table, so opening the
+    # index reads nothing and a lookup only loads and scores the handful of
+    # entries sharing the most bands with the query.
+    _VERSION = 1
+
+    def __init__(self, path=None, scope="", max_entries=INDEX_MAX_ENTRIES):
+        self.scope = scope
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path or ":memory:", timeout=5, isolation_level=None,
+            check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query_index (
+                id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                query TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                value TEXT NOT NULL,
+                UNIQUE (scope, query)
+            );
+            CREATE INDEX IF NOT EXISTS query_index_scope_id
+                ON query_index (scope, id);
+            CREATE TABLE IF NOT EXISTS query_bands (
+                band INTEGER NOT NULL,
+                key INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                PRIMARY KEY (band, key, id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS query_bands_id ON query_bands (id);
+            CREATE TRIGGER IF NOT EXISTS query_index_trim
+                AFTER DELETE ON query_index
+            BEGIN
+                DELETE FROM query_bands WHERE id = old.id;
+            END;
+            """
         )
-        print("Command execution cancelled.")
-    except PermissionError:
-        print(
-            f"Error: Permission denied when trying to execute '{command.split()[0]}'."
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < self._VERSION:
+            self._migrate()
+
+    def _migrate(self):
+        # Entries written before the bands table existed get their bands once
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._db.execute(
+                "SELECT id, signature FROM query_index WHERE id NOT IN "
+                "(SELECT id FROM query_bands)").fetchall()
+            for row_id, blob in rows:
+                self._add_bands(row_id, _signature(blob))
+            self._db.execute(f"PRAGMA user_version = {self._VERSION}")
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._db.execute(
+            "SELECT count(*) FROM query_index WHERE scope = ?", (self.scope,)
+        ).fetchone()[0]
+
+    def _add_bands(self, row_id, signature):
+        self._db.executemany(
+            "INSERT OR IGNORE INTO query_bands (band, key, id) VALUES (?, ?, ?)",
+            [(band, key, row_id) for band, key in _band_keys(signature)],
         )
-        print("Command execution cancelled.")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        print("Command execution cancelled.")
-    return False
 
+    def add(self, query, data):
+        query = normalize_query(query)
+        signature = minhash_signature(query)
+        if signature is None:
+            return
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM query_index WHERE scope = ? AND query = ?",
+                (self.scope, query),
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE query_index SET value = ? WHERE id = ?",
+                    (json.dumps(data), row[0]),
+                )
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO query_index "
+                    "(scope, query, signature, value) VALUES (?, ?, ?, ?)",
+                    (self.scope, query, signature.tobytes(), json.dumps(data)),
+                )
+                if cursor.rowcount:
+                    self._add_bands(cursor.lastrowid, signature)
+                # Trim the oldest rows of all scopes, so those of a prompt or
+                # host description no longer in use go too. Ids grow by one
+                # per entry and only the oldest are deleted, so this keeps at
+                # most max_entries rows. The trigger drops their bands.
+                self._db.execute(
+                    "DELETE FROM query_index WHERE id <= "
+                    "(SELECT max(id) FROM query_index) - ?",
+                    (self.max_entries,),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="CLI tool for generating commands using Groq."
-    )
-    parser.add_argument(
-        "query",
-        nargs="+",
-        help="The operation you want to perform")
-    args = parser.parse_args()
+    def search(self, query, threshold):
+        # Returns (similarity, row id, original query) of the best candidate,
+        # or None
+        signature = minhash_signature(normalize_query(query))
+        if signature is None:
+            return None
+        # Score the entries sharing the most bands with the query
+        keys = _band_keys(signature)
+        bands = " OR ".join(["(band = ? AND key = ?)"] * len(keys))
+        candidates = self._db.execute(
+            "SELECT q.id, q.query, q.signature FROM ("
+            f"SELECT id, count(*) AS hits FROM query_bands WHERE {bands} "
+            "GROUP BY id) AS b JOIN query_index AS q ON q.id = b.id "
+            "WHERE q.scope = ? ORDER BY b.hits DESC LIMIT ?",
+            [value for pair in keys for value in pair]
+            + [self.scope, _MINHASH_CANDIDATES],
+        )
 
-    query = " ".join(args.query)
-    result = get_commands(query)
+        best = None
+        width = len(signature)
+        actions = query_actions(query)
+        for row_id, stored_query, blob in candidates:
+            if query_actions(stored_query) != actions:
+                continue
+            stored = _signature(blob)
+            score = sum(map(operator.eq, signature, stored)) / width
+            if score >= threshold and (best is None or score > best[0]):
+                best = (score, row_id, stored_query)
+        return best
 
-    if result is None:
-        print("Failed to get valid commands. Please try again.")
-        return
+    def lookup(self, query, threshold=SIMILARITY_THRESHOLD):
+        # Returns (similarity, original query, data) for the closest match
+        with self._lock:
+            best = self.search(query, threshold)
+            if best is None:
+                return None
+            score, row_id, stored_query = best
+            row = self._db.execute(
+                "SELECT value FROM query_index WHERE id = ?", (row_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return score, stored_query, json.loads(row[0])
 
-    selected_command = display_and_select_command(result["commands"])
+_indexes = {}
 
-    if selected_command:
-        success = execute_command(selected_command["command"])
-        if not success and "installation" in selected_command:
+
+def get_query_index():
+    # One index per prompt and host description, which can change while a
+    # daemon or shell runs
+    path = os.path.join(cache_dir(), "cache.sqlite3")
+    scope = cache_key("index", "", _prompt_id(COMMANDS_SYSTEM_PROMPT))
+    with _caches_lock:
+        if (path, scope) not in _indexes:
+            _indexes[path, scope] = QueryIndex(path, scope)
+        return _indexes[path, scope]
+
+
+def lookup_commands(query, similarity=SIMILARITY_THRESHOLD):
+    data = get_cache().get(
+        "commands",
+        cache_key("commands", query, _prompt_id(COMMANDS_SYSTEM_PROMPT)))
+    if data is None and similarity:
+        match = get_query_index().lookup(query, similarity)
+        if match is not None and not _reusable(match[2]):
+            match = None
+        get_cache().record("similar", match is not None)
+        if match is not None:
+            score, original, data = match
+            data = dict(
+                data, reused_from={"query": original, "similarity": score})
+    return data
+
+
+def _reusable(data):
+    # Suggestions that delete or kill something are only served for the
+    # exact query, never for a similar one
+    return not any(is_destructive(cmd["command"]) for cmd in data["commands"])
+
+
+def remember_commands(query, data):
+    get_cache().put(
+        "commands",
+        cache_key("commands", query, _prompt_id(COMMANDS_SYSTEM_PROMPT)),
+        data)
+    if _reusable(data):
+        get_query_index().add(query, data)
+
+
+def get_commands(query, use_cache=True, refresh=False,
+                 similarity=SIMILARITY_THRESHOLD, hedge=HEDGE):
+    if use_cache and not refresh:
+        data = lookup_commands(query, similarity)
+        if data is not None:
+            return data
+    data = fetch_commands(query, hedge)
+    if use_cache:
+        remember_commands(query, data)
+    return data
+
+
+def fetch_commands(query, hedge=None, messages=None):
+    # messages replaces the single-query conversation, e.g. with a session's
+    # earlier turns
+    messages = messages or _command_messages(query)
+    if hedge is not None:
+        data, _ = _hedged_completion(
+            "commands", query, messages, _parse_commands, hedge)
+    else:
+        data, _ = _routed_completion(
+            "commands", query, messages, _parse_commands)
+    return data
+
+
+def _parse_commands(content):
+    content = content.strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        telemetry().count("json_repair")
+        data = extract_json(content)
+    return validate_commands(data)
+
+
+def validate_commands(data):
+    # Validate the structure of the parsed data
+    if (
+        not isinstance(data, dict)
+        or "commands" not in data
+        or not isinstance(data["commands"], list)
+    ):
+        raise ValueError("Invalid response structure")
+
+    for cmd in data["commands"]:
+        if not isinstance(cmd, dict) or "command" not in cmd:
+            raise ValueError("Invalid command structure in response")
+
+    return data
+
+
+# Runs that extract_json() copies unchanged, outside and inside strings
+_JSON_PLAIN = re.compile(r'[^"{}\[\],:]*')
+_JSON_STRING_PLAIN = re.compile(r'[^"\\\x00-\x1f]*')
+_JSON_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_JSON_ESCAPES = frozenset('"\\/bfnrt')
+_JSON_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_JSON_DECODER = json.JSONDecoder()
+
+
+def extract_json(text):
+    # One linear pass over a model response that json.loads() rejected.
+    # Copies the outermost object, ignoring prose around it; escapes stray
+    # backslashes and raw control characters in strings; drops trailing
+    # commas. If the response was cut off it is rolled back to the last
+    # complete entry of the outermost object or its arrays, and whatever is
+    # still open is closed, so the entries that did arrive are kept.
+    pos = text.find("{")
+    if pos < 0:
+        raise ValueError("No valid JSON object found in the response")
+    try:
+        # Most often the object is intact and only surrounded by prose
+        return _JSON_DECODER.raw_decode(text, pos)[0]
+    except json.JSONDecodeError:
+        pass
+    out = []
+    stack = ""  # closing characters of the open containers, outermost first
+    last = ""  # last structural character, or "v" after a value
+    safe = (0, "")  # pieces of out and open containers at the last cut point
+    end = len(text)
+    while pos < end:
+        plain = _JSON_PLAIN.match(text, pos).end()
+        if plain > pos:
+            out.append(text[pos:plain])
+            if not out[-1].isspace():
+                last = "v"  # a number, true, false or null
+            pos = plain
+            if pos == end:
+                break
+        ch = text[pos]
+        pos += 1
+        if ch == '"':
+            out.append(ch)
+            closed = False
+            while pos < end:
+                plain = _JSON_STRING_PLAIN.match(text, pos).end()
+                out.append(text[pos:plain])
+                pos = plain
+                if pos == end:
+                    break
+                ch = text[pos]
+                if ch == '"':
+                    out.append(ch)
+                    pos += 1
+                    closed = True
+                    break
+                if ch == "\\":
+                    escaped = text[pos + 1:pos + 2]
+                    if escaped and escaped in _JSON_ESCAPES:
+                        out.append(text[pos:pos + 2])
+                        pos += 2
+                    elif escaped == "u" and _JSON_HEX4.match(text, pos + 2):
+                        out.append(text[pos:pos + 6])
+                        pos += 6
+                    else:
+                        # A shell backslash the model forgot to escape
+                        out.append("\\\\")
+                        pos += 1
+                else:
+                    out.append(_JSON_CONTROL.get(ch) or "\\u%04x" % ord(ch))
+                    pos += 1
+            value = last == ":" or stack[-1:] == "]"
+            if closed and value and "}" not in stack[1:]:
+                safe = (len(out), stack)
+            last = "v"
+        elif ch in "{[":
+            out.append(ch)
+            stack += "}" if ch == "{" else "]"
+            last = ch
+            if "}" not in stack[1:]:
+                safe = (len(out), stack)
+        elif ch in "}]":
+            # Drop a trailing comma
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            # A mismatched bracket closes the container that is open
+            out.append(stack[-1])
+            stack = stack[:-1]
+            last = "v"
+            if not stack:
+                break
+            if "}" not in stack[1:]:
+                safe = (len(out), stack)
+        elif ch == ",":
+            if last not in "{[," and "}" not in stack[1:]:
+                safe = (len(out), stack)
+            out.append(ch)
+            last = ch
+        else:  # ":"
+            out.append(ch)
+            last = ch
+    if stack:
+        pieces, stack = safe
+        out = out[:pieces]
+        out.append(stack[::-1])
+    try:
+        return json.loads("".join(out))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Failed to parse the response as JSON: {e}")
+
+
+class CommandArrayParser:
+    # Incrementally scans a streamed response and yields each object of the
+    # "commands" array as soon as its closing brace arrives.
+    def __init__(self, key="commands"):
+        self.key = key
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.closed = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.start = 0
+
+    def feed(self, text):
+        self.buffer += text
+        items = []
+        if not self.in_array:
+            match = re.search(r'"%s"\s*:\s*\[' % self.key, self.buffer)
+            if not match:
+                return items
+            self.in_array = True
+            self.pos = match.end()
+
+        buffer = self.buffer
+        pos = self.pos
+        while pos < len(buffer) and not self.closed:
+            ch = buffer[pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.start = pos
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    item = _parse_command_object(buffer[self.start:pos + 1])
+                    if item is not None:
+                        items.append(item)
+            elif ch == "]" and self.depth == 0:
+                self.closed = True
+            pos += 1
+        self.pos = pos
+        return items
+
+
+def _parse_command_object(text):
+    try:
+        item = json.loads(text)
+    except json.JSONDecodeError:
+        # Same repair as the non-streaming path
+        try:
+            item = extract_json(text)
+        except ValueError:
+            return None
+    if not isinstance(item, dict) or "command" not in item:
+        return None
+    return item
+
+
+class CommandStream:
+    # Streams a get_commands response on a background thread. Parsed commands
+    # are appended to self.commands as they complete so the selector can
+    # offer them while the rest of the response is still being generated.
+    def __init__(self, query, on_complete=None):
+        self.query = query
+        self.on_complete = on_complete
+        self.commands = []
+        self.done = threading.Event()
+        self.error = None
+        self.first_command_time = None
+        self.first_token_time = None
+        self.total_time = None
+        self._started = None
+        self._telemetry = telemetry()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self
+
+    def _run(self):
+        decision = classify_request(self.query)
+        route = decision["route"] if ROUTING else "large"
+        escalated = False
+        try:
+            while True:
+                try:
+                    self._stream(MODELS[route])
+                    break
+                except Exception:
+                    # Escalate unless the small model's commands are shown
+                    if route == "large" or self.commands:
+                        raise
+                    route, escalated = "large", True
+            if self.on_complete is not None:
+                self.on_complete({"commands": self.commands})
+        except Exception as e:
+            self.error = e
+        finally:
+            self.total_time = time.monotonic() - self._started
+            self._telemetry.add_route("commands", decision, route, escalated)
+            self.done.set()
+
+    def _stream(self, model):
+        parser = CommandArrayParser()
+        usage = None
+        started = time.monotonic()
+        first_token = None
+        try:
+            completion = _create_completion(
+                _command_messages(self.query), stream=True, model=model)
+            for chunk in completion:
+                # Groq reports token usage on the final chunk
+                usage = _usage_of(getattr(chunk, "x_groq", None)) or usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                if self.first_token_time is None:
+                    self.first_token_time = time.monotonic() - self._started
+                for item in parser.feed(text):
+                    if self.first_command_time is None:
+                        self.first_command_time = (
+                            time.monotonic() - self._started)
+                    self.commands.append(item)
+            if not self.commands:
+                raise ValueError("No valid commands found in the response")
+        finally:
+            self._telemetry.add_call(
+                model, time.monotonic() - started, usage, first_token)
+
+    def timing_summary(self):
+        if self.first_command_time is None:
+            first = "no command received"
+        else:
+            first = f"first command after {self.first_command_time:.2f}s"
+        if self.done.is_set():
+            total = f"full response after {self.total_time:.2f}s"
+        else:
+            total = "full response still streaming"
+        return f"Timing: {first}, {total}"
+
+
+_ERROR_MASKS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?(?:[.,]\d+)?"
+                r"(?:Z|[+-]\d{2}:?\d{2})?"), "<time>"),
+    (re.compile(r"\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) +"
+                r"\d{1,2} \d{2}:\d{2}:\d{2}\b"), "<time>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}\b"),
+     "<uuid>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-f]*[a-f])(?=[0-9a-f]*\d)"
+                r"[0-9a-f]{7,}\b"), "<hex>"),
+    (re.compile(r"\b[a-z][a-z0-9+.-]*://[^\s'\"`]+"), "<url>"),
+    (re.compile(r"(?:~|\.{1,2})?/[^\s:'\"`,;()]+"), "<path>"),
+    (re.compile(r"\b\d+\b"), "<n>"),
+]
+
+
+def normalize_error(text):
+    # Masks the parts of an error that vary between occurrences (times, ids,
+    # addresses, paths, numbers, this host and user) so recurring classes of
+    # failure reduce to the same fingerprint text
+    for name, mask in ((socket.gethostname(), "<host>"),
+                       (getpass.getuser(), "<user>")):
+        if name and len(name) > 2:
+            text = re.sub(r"\b%s\b" % re.escape(name), mask, text)
+    for pattern, mask in _ERROR_MASKS:
+        text = pattern.sub(mask, text)
+    return " ".join(text.split())
+
+
+def error_fingerprint(error_message, command=None):
+    text = normalize_error(error_message)
+    if command:
+        text = normalize_error(command) + "\n" + text
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def handle_error(error_message, command=None, use_cache=True, refresh=False):
+    # Cached analyses are keyed on the normalized error, so a failure seen
+    # before with other paths, PIDs or timestamps is answered locally
+    fingerprint = error_fingerprint(error_message, command)
+    key = cache_key("error", fingerprint, _prompt_id(ERROR_SYSTEM_PROMPT))
+    if use_cache and not refresh:
+        data = get_cache().get("error", key)
+        if data is not None:
+            return dict(
+                data, source=f"cached analysis of error {fingerprint[:12]}")
+    data = fetch_error_analysis(error_message, command)
+    if use_cache:
+        cached = {k: v for k, v in data.items() if k != "usage"}
+        get_cache().put("error", key, cached)
+    return data
+
+
+def fetch_error_analysis(error_message, command=None):
+    content = f"Error message: {error_message}"
+    if command:
+        content = f"Failing command: {command}\n{content}"
+    data, usage = _routed_completion(
+        "error", error_message,
+        _system_messages(ERROR_SYSTEM_PROMPT)
+        + [{"role": "user", "content": content}],
+        _parse_error_analysis,
+    )
+    if usage is not None:
+        data["usage"] = usage
+    return data
+
+
+def _parse_error_analysis(content):
+    content = content.strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        telemetry().count("json_repair")
+        data = extract_json(content)
+
+    if (
+        not isinstance(data, dict)
+        or "explanation" not in data
+        or "solutions" not in data
+    ):
+        raise ValueError("Invalid error handling response structure")
+    return data
+
+
+def _usage_of(completion):
+    usage = getattr(completion, "usage", None)
+    tokens = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+    if not all(isinstance(count, int) for count in tokens.values()):
+        return None
+    return tokens
+
+
+ErrorRule = namedtuple(
+    "ErrorRule", ["name", "pattern", "details", "explanation", "solutions"])
+
+# Recognizable failures answered locally instead of through handle_error.
+# `pattern` should start with a literal so the combined regex can scan for it
+# quickly; the optional `details` pattern then runs on the matched line only
+# and its named groups, plus {command}, can be used in the explanation and
+# solutions. Values substituted into solution commands are shell-quoted.
+# A rule whose details pattern does not match leaves the error to the API.
+# The path is quoted ('...', or ‘...’ as GNU tools print it in UTF-8
+# locales), contains a slash, or is the operand in "prog: name: ".
+_ERROR_PATH = (r"['‘]?(?P<path>(?<=['‘])[^'‘’\n]+(?=['’])|"
+               r"[^\s:'‘’()]*/[^\s:'‘’()]*|"
+               r"(?<=: )[^\s:'‘’()]+)['’]?: ")
+
+ERROR_RULES = [
+    ErrorRule(
+        "command-not-found",
+        r"command not found|sh: (?:\d+: )?[\w.+-]+: not found",
+        r"(?:^|sh: (?:line \d+: |\d+: )?)(?P<program>[\w.+-]+): "
+        r"(?:command )?not found(?!:)",
+        "The program '{program}' is not installed or is not on your PATH.",
+        [
+            {"description": "Look for '{program}' outside your PATH",
+             "command": "type -a {program} || "
+                        "ls -l /usr/local/sbin /usr/sbin /sbin | grep {program}"},
+            {"description": "Install it with apt (Debian/Ubuntu)",
+             "command": "sudo apt-get update && sudo apt-get install {program}"},
+            {"description": "Install it with dnf (RHEL/CentOS/Fedora)",
+             "command": "sudo dnf install {program}"},
+            {"description": "Install it with pacman (Arch)",
+             "command": "sudo pacman -S {program}"},
+        ],
+    ),
+    ErrorRule(
+        "permission-denied",
+        r"Permission denied(?! \(publickey)",
+        "(?:" + _ERROR_PATH + ")?Permission denied",
+        "The command was not allowed to access a file or resource{path_hint}.",
+        [
+            {"description": "Run the command again with sudo",
+             "command": "sudo bash -c {command}"},
+            {"description": "Inspect the ownership and permissions involved",
+             "command": "ls -ld {path}"},
+        ],
+    ),
+    ErrorRule(
+        "no-space",
+        r"No space left on device",
+        None,
+        "The file system being written to is full.",
+        [
+            {"description": "Show free space per file system",
+             "command": "df -h"},
+            {"description": "Find the largest directories under your home",
+             "command": "du -xh ~ 2>/dev/null | sort -h | tail -n 20"},
+            {"description": "Trim the systemd journal to 200 MB",
+             "command": "sudo journalctl --vacuum-size=200M"},
+        ],
+    ),
+    ErrorRule(
+        "resolve-host",
+        r"Could not resolve host|Temporary failure in name resolution|"
+        r"Name or service not known|unknown host",
+        None,
+        "A host name could not be resolved, so DNS or the network is "
+        "unavailable or the name is wrong.",
+        [
+            {"description": "Check that the network is reachable by IP",
+             "command": "ping -c 3 1.1.1.1"},
+            {"description": "Show the configured DNS servers",
+             "command": "cat /etc/resolv.conf"},
+            {"description": "Test name resolution directly",
+             "command": "getent hosts example.com"},
+        ],
+    ),
+    ErrorRule(
+        "no-such-file",
+        r"No such file or directory",
+        "(?:" + _ERROR_PATH + ")?No such file or directory",
+        "A file or directory the command needs{path_hint} does not exist.",
+        [
+            {"description": "List the parent directory",
+             "command": "ls -la \"$(dirname {path})\""},
+            {"description": "Search for the file by name below your home",
+             "command": "find ~ -name \"$(basename {path})\" 2>/dev/null"},
+        ],
+    ),
+    ErrorRule(
+        "connection-refused",
+        r"Connection refused",
+        None,
+        "Nothing is accepting connections on the target host and port.",
+        [
+            {"description": "List listening TCP ports and their processes",
+             "command": "sudo ss -ltnp"},
+            {"description": "Show failed systemd services",
+             "command": "systemctl --failed"},
+        ],
+    ),
+    ErrorRule(
+        "address-in-use",
+        r"Address already in use",
+        None,
+        "Another process is already listening on the requested port.",
+        [
+            {"description": "Show which process holds the listening ports",
+             "command": "sudo ss -ltnp"},
+        ],
+    ),
+    ErrorRule(
+        "read-only-fs",
+        r"Read-only file system",
+        None,
+        "The target file system is mounted read-only.",
+        [
+            {"description": "Show the mount options of file systems",
+             "command": "findmnt -o TARGET,SOURCE,OPTIONS"},
+        ],
+    ),
+    ErrorRule(
+        "apt-unknown-package",
+        r"E: Unable to locate package",
+        r"Unable to locate package (?P<package>\S+)",
+        "apt does not know the package '{package}'; the package lists may be "
+        "stale or the name differs on this distribution.",
+        [
+            {"description": "Refresh the package lists and retry",
+             "command": "sudo apt-get update && sudo apt-get install {package}"},
+            {"description": "Search for similarly named packages",
+             "command": "apt-cache search {package}"},
+        ],
+    ),
+    ErrorRule(
+        "package-lock",
+        r"Could not get lock|Unable to acquire the dpkg frontend lock|"
+        r"Unable to lock the administration directory",
+        r"(?:Could not get lock |lock \(|directory \()"
+        r"(?P<path>[^\s.)]+(?:\.[^\s.)]+)*)",
+        "Another package manager process holds the lock{path_hint}.",
+        [
+            {"description": "Show the running package manager processes",
+             "command": "ps aux | grep -E 'apt|dpkg' | grep -v grep"},
+        ],
+    ),
+    ErrorRule(
+        "too-many-open-files",
+        r"Too many open files",
+        None,
+        "The process hit its limit on open file descriptors.",
+        [
+            {"description": "Show the current open file limit",
+             "command": "ulimit -n"},
+        ],
+    ),
+    ErrorRule(
+        "out-of-memory",
+        r"Cannot allocate memory|Out of memory",
+        None,
+        "The system ran out of memory while running the command.",
+        [
+            {"description": "Show memory and swap usage",
+             "command": "free -h"},
+            {"description": "Show the processes using the most memory",
+             "command": "ps aux --sort=-%mem | head -n 10"},
+        ],
+    ),
+]
+
+_compiled_rules = None
+
+
+def register_error_rule(name, pattern, explanation, solutions,
+                        details=None):
+    global _compiled_rules
+    ERROR_RULES.append(
+        ErrorRule(name, pattern, details, explanation, solutions))
+    _compiled_rules = None
+
+
+def _compile_error_rules():
+    # One alternation over every rule's pattern, with each rule identified by
+    # its named group, plus the compiled details patterns. When every pattern
+    # starts with a literal, a lookahead on the possible first characters
+    # lets the scan skip most positions without trying each alternative.
+    global _compiled_rules
+    if _compiled_rules is None:
+        alternatives = "|".join(
+            "(?P<r%d>%s)" % (idx, rule.pattern)
+            for idx, rule in enumerate(ERROR_RULES)
+        )
+        first_chars = set()
+        for rule in ERROR_RULES:
+            for branch in rule.pattern.split("|"):
+                if not branch or branch[0] in "\\.^$*+?{}[]()":
+                    first_chars = None
+                    break
+                first_chars.add(branch[0])
+            if first_chars is None:
+                break
+        if first_chars:
+            alternatives = "(?=[%s])(?:%s)" % (
+                "".join(sorted(re.escape(ch) for ch in first_chars)),
+                alternatives,
+            )
+        _compiled_rules = (
+            re.compile(alternatives),
+            [rule.details and re.compile(rule.details)
+             for rule in ERROR_RULES],
+        )
+    return _compiled_rules
+
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def triage_error(error_text, command=""):
+    # Returns an {"explanation", "solutions"} analysis from a local rule, or
+    # None when no rule matches and the API has to be asked. Only the last
+    # line of the error is matched: that is where the failure is reported,
+    # and earlier lines are often warnings about something else.
+    lines = (error_text or "").strip().splitlines()
+    if not lines:
+        return None
+    line = lines[-1]
+    combined, patterns = _compile_error_rules()
+    match = combined.search(line)
+    if match is None:
+        return None
+    idx = int(match.lastgroup[1:])
+    rule = ERROR_RULES[idx]
+    values = {}
+    if patterns[idx] is not None:
+        details = patterns[idx].search(line)
+        if details is None:
+            return None
+        values = {key: value for key, value
+                  in details.groupdict().items() if value}
+    path = values.get("path")
+    explain = dict(values, command=command,
+                   path_hint=f" ({path})" if path else "")
+    quoted = dict(
+        {key: shlex.quote(value) for key, value in values.items()},
+        command=shlex.quote(command))
+
+    def complete(template, available):
+        return all(name in available for name in _PLACEHOLDER.findall(template))
+
+    # Templates that need a value the error did not contain are left out
+    if not complete(rule.explanation, explain):
+        return None
+    solutions = [
+        {
+            "description": solution["description"].format_map(explain),
+            "command": solution["command"].format_map(quoted),
+        }
+        for solution in rule.solutions
+        if complete(solution["description"], explain)
+        and complete(solution["command"], quoted)
+    ]
+    if not solutions:
+        return None
+    return {
+        "explanation": rule.explanation.format_map(explain),
+        "solutions": solutions,
+        "source": f"local rule: {rule.name}",
+    }
+
+
+def daemon_socket_path():
+    return os.getenv("GROQ_CLI_SOCKET") or os.path.join(
+        cache_dir(), "daemon.sock")
+
+
+def daemon_request(request, path=None, timeout=None):
+    # Returns the daemon's response, or None if no daemon is listening or
+    # it does not answer properly, so the caller works in-process instead
+    path = path or daemon_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        try:
+            sock.connect(path)
+            sock.settimeout(timeout or DAEMON_TIMEOUT)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as reader:
+                response = json.loads(reader.readline())
+        except (OSError, ValueError):
+            # Not running, hung past the timeout, reset or cut short
+            return None
+    finally:
+        sock.close()
+    if not response["ok"]:
+        raise ValueError(response["error"])
+    return response["data"]
+
+
+def request_commands(query, use_cache=True, refresh=False,
+                     similarity=SIMILARITY_THRESHOLD, hedge=HEDGE):
+    # Forward to a running daemon, or resolve in-process without one
+    start = time.perf_counter()
+    data = daemon_request(
+        {
+            "op": "commands",
+            "query": query,
+            "use_cache": use_cache,
+            "refresh": refresh,
+            "similarity": similarity,
+            "hedge": hedge,
+        }
+    )
+    if data is None:
+        data = get_commands(query, use_cache, refresh, similarity, hedge)
+    else:
+        telemetry().add_time("daemon", time.perf_counter() - start)
+    return data
+
+
+def request_error_analysis(error_message, command=None, use_cache=True,
+                           refresh=False):
+    start = time.perf_counter()
+    data = daemon_request(
+        {
+            "op": "error",
+            "error_message": error_message,
+            "command": command,
+            "use_cache": use_cache,
+            "refresh": refresh,
+        }
+    )
+    if data is None:
+        data = handle_error(error_message, command, use_cache, refresh)
+    else:
+        telemetry().add_time("daemon", time.perf_counter() - start)
+    return data
+
+
+def _daemon_dispatch(request):
+    op = request.get("op")
+    if op == "ping":
+        return {"pid": os.getpid()}
+    if op == "commands":
+        with recording("daemon commands", thread_only=True):
+            return get_commands(
+                request["query"],
+                request.get("use_cache", True),
+                request.get("refresh", False),
+                request.get("similarity", SIMILARITY_THRESHOLD),
+                HedgePolicy(*request["hedge"]) if request.get("hedge")
+                else None,
+            )
+    if op == "error":
+        with recording("daemon error", thread_only=True):
+            return handle_error(
+                request["error_message"],
+                request.get("command"),
+                request.get("use_cache", True),
+                request.get("refresh", False),
+            )
+    raise ValueError(f"Unknown daemon request: {op!r}")
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {
+                    "ok": True, "data": _daemon_dispatch(json.loads(line))}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def daemon_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="groq-cli daemon",
+        description="Serve queries over a Unix socket with a warm API client, "
+        "response cache and query index.",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Socket path (default: $GROQ_CLI_SOCKET or daemon.sock in the "
+        "cache directory)",
+    )
+    args = parser.parse_args(argv)
+    path = args.socket or daemon_socket_path()
+
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            print(f"{path} exists and is not a socket; not replacing it")
+            sys.exit(1)
+        if daemon_request({"op": "ping"}, path,
+                          DAEMON_CONNECT_TIMEOUT) is not None:
+            print(f"A daemon is already listening on {path}")
+            sys.exit(1)
+        os.unlink(path)
+
+    # Warm everything a query needs before accepting connections
+    get_client()
+    get_cache()
+    get_query_index()
+
+    old_umask = os.umask(0o077)
+    try:
+        server = _DaemonServer(path, _DaemonHandler)
+    finally:
+        os.umask(old_umask)
+    print(f"groq-cli daemon listening on {path}")
+    # Exit through the cleanup below on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# Escape sequences of the keys the selector understands
+_KEY_SEQUENCES = {
+    "\x1b[A": "up", "\x1bOA": "up", "\x1b[B": "down", "\x1bOB": "down",
+    "\x1b[5~": "pgup", "\x1b[6~": "pgdn", "\x1b[H": "home", "\x1b[1~": "home",
+    "\x1b[F": "end", "\x1b[4~": "end",
+}
+_KEY_NAMES = {"\r": "enter", "\n": "enter", "\x7f": "backspace",
+              "\x08": "backspace", "\x03": "ctrl-c", "\x1b": "escape"}
+_ESCAPE_SEQUENCE = re.compile(r"\x1b(?:\[[0-9;]*[A-Za-z~]|O[A-Za-z])")
+# The start of an escape sequence cut off at the end of a read
+_ESCAPE_PREFIX = re.compile(r"\x1b(?:\[[0-9;]*|O)?\Z")
+# Seconds to wait for the rest of a cut-off escape sequence before taking
+# the ESC as a key press of its own
+ESCAPE_WAIT = 0.05
+
+
+def parse_keys(text):
+    # Splits what one read returned into key names and typed characters.
+    # Unknown escape sequences are dropped; a lone ESC is "escape".
+    keys = []
+    pos = 0
+    while pos < len(text):
+        match = _ESCAPE_SEQUENCE.match(text, pos)
+        if match:
+            key = _KEY_SEQUENCES.get(match.group())
+            if key:
+                keys.append(key)
+            pos = match.end()
+            continue
+        keys.append(_KEY_NAMES.get(text[pos], text[pos]))
+        pos += 1
+    return keys
+
+
+def fuzzy_score(query, text):
+    # Lower is a better match: a substring beats a scattered subsequence,
+    # and fewer skipped characters and an earlier start rank higher. None
+    # if the characters of query do not all appear in order.
+    query = query.lower()
+    text = text.lower()
+    found = text.find(query)
+    if found >= 0:
+        return (0, found)
+    pos = -1
+    start = None
+    gaps = 0
+    for ch in query:
+        found = text.find(ch, pos + 1)
+        if found < 0:
+            return None
+        if start is None:
+            start = found
+        else:
+            gaps += found - pos - 1
+        pos = found
+    return (1 + gaps, start)
+
+
+class Selector:
+    # Arrow-key picker shared by the command and solution menus. It stays in
+    # raw mode while open and redraws only the lines that changed, in one
+    # write per update. Long lists scroll within the terminal, '/' filters by
+    # fuzzy match over command and description, and items appended to
+    # `items` while it is open (by a CommandStream) show up as they arrive.
+    # With multi, Space or Tab marks items and run() returns a list: the
+    # marked items, else the highlighted one.
+    def __init__(self, items, title, note=None, stream=None, annotate=None,
+                 multi=False, fd=None, out_fd=None, size=None):
+        self.items = items
+        self.title = title
+        self.note = note
+        self.stream = stream
+        # annotate(item) -> (suffix after the command, extra detail lines
+        # shown under the selected item)
+        self.annotate = annotate or (lambda item: ("", []))
+        self.multi = multi
+        self.marked = set()  # indexes into items
+        self.fd = fd
+        self.out_fd = out_fd
+        self.size = size
+        self.query = None  # the filter while filtering, else None
+        self.visible = []  # indexes into items that pass the filter
+        self.selected = 0  # position in visible
+        self.top = 0  # first position of visible in the viewport
+        self.result = None
+        self._seen = 0
+        self._lines = []
+        self._cleared = False
+        self._resized = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def run(self):
+        fd = sys.stdin.fileno() if self.fd is None else self.fd
+        out = sys.stdout.fileno() if self.out_fd is None else self.out_fd
+        sys.stdout.flush()
+        if self.size is None:
+            self.size = _terminal_size(out)
+        old_settings = termios.tcgetattr(fd) if os.isatty(fd) else None
+        old_winch = None
+        if threading.current_thread() is threading.main_thread():
+            old_winch = signal.signal(signal.SIGWINCH, self._on_resize)
+        try:
+            if old_settings is not None:
+                tty.setraw(fd)
+            self._refilter()
+            while True:
+                streaming = (self.stream is not None
+                             and not self.stream.done.is_set())
+                if len(self.items) != self._seen:
+                    self._refilter()
+                if self.stream is not None and not streaming and not self.items:
+                    return None
+                if self._resized:
+                    self._resized = False
+                    self.size = _terminal_size(out)
+                    self._lines = []
+                    self._cleared = False
+                self._draw(out, streaming)
+                ready = select.select([fd], [], [], 0.1 if streaming else None)
+                if not ready[0]:
+                    continue
+                text = self._read_keys(fd)
+                if text is None:
+                    return None
+                for key in parse_keys(text):
+                    if self._handle(key):
+                        return self.result
+        finally:
+            if old_settings is not None:
+                termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+            if old_winch is not None:
+                signal.signal(signal.SIGWINCH, old_winch)
+            # Leave the cursor below the list for whatever prints next
+            os.write(out, f"\033[{len(self._lines) + 1};1H\033[?25h".encode())
+
+    def _read_keys(self, fd):
+        # Over SSH or a slow pty an arrow key can arrive in two reads, so a
+        # read ending in part of an escape sequence waits briefly for the rest
+        data = os.read(fd, 64)
+        if not data:
+            return None
+        text = self._decoder.decode(data)
+        while (_ESCAPE_PREFIX.search(text)
+               and select.select([fd], [], [], ESCAPE_WAIT)[0]):
+            data = os.read(fd, 64)
+            if not data:
+                break
+            text += self._decoder.decode(data)
+        return text
+
+    def _on_resize(self, signum, frame):
+        self._resized = True
+
+    def _handle(self, key):
+        # Returns True once the selector should close with self.result
+        if key == "ctrl-c":
+            return True
+        if key in ("up", "down", "pgup", "pgdn", "home", "end"):
+            if self.visible:
+                page = max(1, self._item_rows())
+                step = {"up": -1, "down": 1, "pgup": -page, "pgdn": page}
+                if key in ("up", "down"):
+                    self.selected = (self.selected + step[key]) % len(self.visible)
+                elif key in ("pgup", "pgdn"):
+                    self.selected = min(max(self.selected + step[key], 0),
+                                        len(self.visible) - 1)
+                else:
+                    self.selected = 0 if key == "home" else len(self.visible) - 1
+            return False
+        if key == "enter":
+            if not self.visible:
+                return False
+            current = self.visible[self.selected]
+            if self.multi:
+                self.result = [self.items[idx]
+                               for idx in sorted(self.marked or {current})]
+            else:
+                self.result = self.items[current]
+            return True
+        if self.multi and (key == "\t" or (key == " " and self.query is None)):
+            if self.visible:
+                self.marked ^= {self.visible[self.selected]}
+                self.selected = min(self.selected + 1, len(self.visible) - 1)
+            return False
+        if self.query is not None:
+            if key == "escape":
+                self.query = None
+            elif key == "backspace":
+                self.query = self.query[:-1]
+            elif len(key) == 1 and key.isprintable():
+                self.query += key
+            else:
+                return False
+            self._refilter()
+            return False
+        if key == "/":
+            self.query = ""
+            self._refilter()
+        elif key in ("c", "escape"):
+            return True
+        return False
+
+    def _refilter(self):
+        current = (self.visible[self.selected]
+                   if self.selected < len(self.visible) else None)
+        self._seen = len(self.items)
+        if self.query:
+            scored = []
+            for idx, item in enumerate(self.items):
+                score = fuzzy_score(self.query, f"{item['command']} "
+                                    f"{item.get('description', '')}")
+                if score is not None:
+                    scored.append((score, idx))
+            scored.sort()
+            self.visible = [idx for _, idx in scored]
+        else:
+            self.visible = list(range(len(self.items)))
+        self.selected = (self.visible.index(current)
+                         if current in self.visible else 0)
+
+    def _item_rows(self):
+        # Rows left for list entries once the header, the selected entry's
+        # detail lines and the footer are drawn
+        header = 1 + (self.note is not None) + (self.query is not None)
+        details = 1
+        if self.visible:
+            details += len(self.annotate(self.items[self.visible[self.selected]])[1])
+        return max(1, self.size[1] - header - details - 1)
+
+    def _frame(self, streaming):
+        width = self.size[0] - 1
+        lines = [self.title[:width]]
+        if self.note is not None:
+            lines.append(f"\033[33m{self.note[:width]}\033[0m")
+        if self.query is not None:
+            lines.append(
+                f"\033[36m/{self.query}\033[0m  \033[2m({len(self.visible)} "
+                f"of {len(self.items)} match)\033[0m")
+        rows = self._item_rows()
+        self.top = min(max(self.top, self.selected - rows + 1), self.selected)
+        self.top = max(0, min(self.top, max(0, len(self.visible) - rows)))
+        for pos in range(self.top, min(self.top + rows, len(self.visible))):
+            item = self.items[self.visible[pos]]
+            suffix, details = self.annotate(item)
+            mark = ""
+            if self.multi:
+                mark = "[x] " if self.visible[pos] in self.marked else "[ ] "
+            command = mark + item["command"][:width - 2 - len(mark)]
+            if pos == self.selected:
+                lines.append(f"\033[1;32m» {command}\033[0m{suffix}")
+                description = item.get("description", "")[:width - 2]
+                lines.append(f"  \033[1;32m{description}\033[0m")
+                lines.extend(details)
+            else:
+                lines.append(f"  {command}{suffix}")
+        footer = []
+        if len(self.visible) > rows:
+            last = min(self.top + rows, len(self.visible))
+            footer.append(f"{self.top + 1}-{last} of {len(self.visible)}")
+        if streaming:
+            footer.append("...loading more commands")
+        lines.append(f"\033[2m  {'  '.join(footer)}\033[0m" if footer else "")
+        return lines
+
+    def _draw(self, out, streaming):
+        lines = self._frame(streaming)
+        parts = []
+        if not self._cleared:
+            parts.append("\033[?25l\033[2J")  # hide cursor, clear screen
+            self._cleared = True
+        for row, line in enumerate(lines):
+            if row >= len(self._lines) or self._lines[row] != line:
+                parts.append(f"\033[{row + 1};1H{line}\033[K")
+        if len(lines) < len(self._lines):
+            parts.append(f"\033[{len(lines) + 1};1H\033[J")
+        self._lines = lines
+        if parts:
+            os.write(out, "".join(parts).encode())
+
+
+def _terminal_size(fd):
+    try:
+        size = os.get_terminal_size(fd)
+        return size.columns, size.lines
+    except OSError:
+        return 80, 24
+
+
+def display_and_select_command(commands, stream=None, note=None, multi=False):
+    # With a CommandStream, commands arriving while the list is displayed are
+    # drawn as they come in and can be selected before the stream finishes.
+    # With multi, returns a list of one or more commands to run.
+    if stream is not None:
+        commands = stream.commands
+    missing = {}
+
+    def annotate(cmd):
+        if cmd["command"] not in missing:
+            missing[cmd["command"]] = missing_binaries(cmd["command"])
+        absent = missing[cmd["command"]]
+        if not absent:
+            return "", []
+        details = []
+        if cmd.get("installation"):
+            details.append(
+                f"  \033[33mInstall with: {cmd['installation']}\033[0m")
+        return (f"  \033[33m(not installed: {', '.join(absent)})\033[0m",
+                details)
+
+    title = "Welcome to groq-cli. Use arrows to select, "
+    if multi:
+        title += "space to mark several, "
+    return Selector(
+        commands, title + "'/' to filter or press 'c' to cancel",
+        note=note, stream=stream, annotate=annotate, multi=multi,
+    ).run()
+
+
+def display_and_select_solution(solutions):
+    return Selector(
+        solutions,
+        "Use arrows to select a solution, '/' to filter or press 'c' to cancel",
+    ).run()
+
+
+class TailBuffer:
+    # Keeps only the last `limit` bytes written to it. Deleting from the front
+    # of a bytearray is amortized O(1), so this behaves as a ring buffer.
+    def __init__(self, limit=OUTPUT_TAIL_BYTES):
+        self.limit = limit
+        self.total = 0
+        self._data = bytearray()
+
+    def __len__(self):
+        return len(self._data)
+
+    def write(self, data):
+        self.total += len(data)
+        self._data += data[-self.limit:]
+        excess = len(self._data) - self.limit
+        if excess > 0:
+            del self._data[:excess]
+
+    def getvalue(self):
+        return bytes(self._data)
+
+
+CommandResult = namedtuple(
+    "CommandResult",
+    ["returncode", "stdout", "stderr", "elapsed", "peak_buffered"],
+)
+
+
+def _write_to(stream):
+    def write(data):
+        buffer = getattr(stream, "buffer", None)
+        if buffer is not None:
+            buffer.write(data)
+        else:
+            stream.write(data.decode(errors="replace"))
+        stream.flush()
+
+    return write
+
+
+def run_streaming(command, on_stdout=None, on_stderr=None,
+                  tail_bytes=OUTPUT_TAIL_BYTES):
+    # Runs command through bash, passing output to the callbacks (the terminal
+    # by default) as it arrives. Only the tail of each stream is kept, so
+    # memory stays flat however much the command prints.
+    start = time.monotonic()
+    # Use bash to execute the command, which allows for proper expansion of
+    # {1..10}
+    process = subprocess.Popen(
+        ["bash", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    streams = {
+        process.stdout: (on_stdout or _write_to(sys.stdout),
+                         TailBuffer(tail_bytes)),
+        process.stderr: (on_stderr or _write_to(sys.stderr),
+                         TailBuffer(tail_bytes)),
+    }
+    peak_buffered = 0
+    with selectors.DefaultSelector() as selector:
+        for pipe in streams:
+            os.set_blocking(pipe.fileno(), False)
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                try:
+                    data = os.read(key.fd, OUTPUT_CHUNK_BYTES)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    continue
+                callback, tail = streams[key.fileobj]
+                callback(data)
+                tail.write(data)
+                peak_buffered = max(
+                    peak_buffered, sum(len(t) for _, t in streams.values()))
+    returncode = process.wait()
+    stdout_tail = streams[process.stdout][1].getvalue()
+    stderr_tail = streams[process.stderr][1].getvalue()
+    return CommandResult(
+        returncode,
+        stdout_tail.decode(errors="replace"),
+        stderr_tail.decode(errors="replace"),
+        time.monotonic() - start,
+        peak_buffered,
+    )
+
+
+def _error_context(error, chars=ERROR_CONTEXT_CHARS):
+    # Exit status plus the tail of stderr (or stdout when stderr is empty)
+    output = error.stderr or error.stdout or ""
+    output = output[-chars:].strip()
+    return f"Exit code {error.returncode}\n{output}".strip()
+
+
+def _print_repair_summary(attempts):
+    print("\nRepair summary:")
+    for idx, attempt in enumerate(attempts, 1):
+        line = (
+            f"{idx}. {attempt['command']}\n"
+            f"   exit {attempt['returncode']}, ran {attempt['elapsed']:.2f}s"
+        )
+        if attempt["analysis"]:
+            line += (
+                f", analysis {attempt['analysis_time']:.2f}s "
+                f"({attempt['analysis']}, {attempt['tokens']} tokens)"
+            )
+        print(line)
+    print(
+        f"Total: {len(attempts)} attempts, "
+        f"{sum(a['elapsed'] + a['analysis_time'] for a in attempts):.2f}s, "
+        f"{sum(a['tokens'] for a in attempts)} tokens"
+    )
+
+
+def execute_command(command, use_cache=True, refresh=False,
+                    max_attempts=MAX_REPAIR_ATTEMPTS,
+                    time_budget=REPAIR_TIME_BUDGET,
+                    token_budget=REPAIR_TOKEN_BUDGET, on_result=None):
+    # Runs command and, while it keeps failing, offers fixes from the error
+    # analysis. Bounded by max_attempts repairs, a wall-clock and a token
+    # budget; commands already tried are not offered again and an error seen
+    # before reuses its earlier analysis instead of asking again.
+    # on_result(command, CommandResult) is called after every run.
+    started = time.monotonic()
+    tried = set()
+    analyses = {}
+    attempts = []
+    tokens_used = 0
+    success = False
+    while True:
+        tried.add(command)
+        attempt = {"command": command, "returncode": None, "elapsed": 0.0,
+                   "analysis": None, "analysis_time": 0.0, "tokens": 0}
+        attempts.append(attempt)
+        print(f"\nExecuting: {command}")
+        try:
+            result = run_streaming(command)
+            telemetry().add_time("execution", result.elapsed)
+            if on_result is not None:
+                on_result(command, result)
+            attempt["returncode"] = result.returncode
+            attempt["elapsed"] = result.elapsed
+            print(
+                f"\nFinished in {result.elapsed:.2f}s with exit code "
+                f"{result.returncode} (peak buffered output: "
+                f"{result.peak_buffered} bytes)"
+            )
+            if result.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    result.returncode,
+                    ["bash", "-c", command],
+                    output=result.stdout,
+                    stderr=result.stderr,
+                )
+            success = True
+            break
+        except subprocess.CalledProcessError as e:
+            # The command's output has already been streamed to the terminal
+            print(f"Error executing command: {e}")
+            print(f"Exit code: {e.returncode}")
+
+            if len(attempts) > max_attempts:
+                print(f"Stopping after {max_attempts} repair attempts.")
+                break
+            if time.monotonic() - started > time_budget:
+                print(
+                    f"Stopping: repair time budget of {time_budget:.0f}s "
+                    "used up.")
+                break
+
+            # Handle the error, locally when a rule recognizes it or when the
+            # same kind of error was already analyzed in this loop
+            context = _error_context(e)
+            fingerprint = error_fingerprint(context)
+            analysis_start = time.monotonic()
+            error_data = analyses.get(fingerprint)
+            if error_data is not None:
+                attempt["analysis"] = "reused"
+            else:
+                error_data = triage_error(e.stderr, command)
+                if error_data is not None:
+                    attempt["analysis"] = "local rule"
+                elif tokens_used >= token_budget:
+                    print(
+                        f"Stopping: token budget of {token_budget} used up.")
+                    break
+                else:
+                    error_data = request_error_analysis(
+                        context, command, use_cache, refresh)
+                    usage = error_data.get("usage") or {}
+                    attempt["tokens"] = sum(usage.values())
+                    tokens_used += attempt["tokens"]
+                    attempt["analysis"] = (
+                        "cached" if "source" in error_data else "api")
+                analyses[fingerprint] = error_data
+            telemetry().count(
+                "analysis." + attempt["analysis"].replace(" ", "_"))
+            attempt["analysis_time"] = time.monotonic() - analysis_start
+
+            print("\nError Analysis:")
+            if "source" in error_data:
+                print(f"({error_data['source']})")
+            print(error_data["explanation"])
+            solutions = [
+                solution for solution in error_data["solutions"]
+                if solution["command"] not in tried
+            ]
+            if not solutions:
+                print("All suggested solutions have already been tried.")
+                break
+            print("\nSuggested Solutions:")
+            for idx, solution in enumerate(solutions, 1):
+                print(f"{idx}. {solution['description']}")
+
+            # Allow the user to select and execute a solution using arrow keys
+            with telemetry().timed("selection"):
+                selected_solution = display_and_select_solution(solutions)
+            if not selected_solution:
+                print("No solution selected. Command execution cancelled.")
+                break
+            command = selected_solution["command"]
+            telemetry().count("repairs")
+        except FileNotFoundError:
+            print(
+                f"Error: Command '{command.split()[0]}' not found. Please check if it's installed and in your PATH."
+            )
+            print("Command execution cancelled.")
+            break
+        except PermissionError:
+            print(
+                f"Error: Permission denied when trying to execute '{command.split()[0]}'."
+            )
+            print("Command execution cancelled.")
+            break
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            print("Command execution cancelled.")
+            break
+
+    if len(attempts) > 1 or tokens_used:
+        _print_repair_summary(attempts)
+    return success
+
+
+class _LabeledLines:
+    # Output callback for run_streaming that writes whole lines to stream,
+    # each prefixed with label, so concurrent commands don't interleave
+    # within a line. The last line without a newline is written by flush().
+    def __init__(self, label, stream, lock):
+        self.label = label.encode()
+        self.write = _write_to(stream)
+        self.lock = lock
+        self.partial = b""
+
+    def __call__(self, data):
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        if lines:
+            self._emit(lines)
+
+    def flush(self):
+        if self.partial:
+            self._emit([self.partial])
+            self.partial = b""
+
+    def _emit(self, lines):
+        text = b"".join(self.label + line + b"\n" for line in lines)
+        with self.lock:
+            self.write(text)
+
+
+def _analyze_failures(failures, use_cache=True, refresh=False):
+    # One analysis for all failed commands: errors a local rule recognizes
+    # are answered here, and the rest go to the API in a single request
+    explanations = []
+    solutions = []
+    remote = []
+    for command, result in failures:
+        data = triage_error(result.stderr, command)
+        if data is None:
+            remote.append((command, result))
+            continue
+        telemetry().count("analysis.local_rule")
+        explanations.append(f"{command}: {data['explanation']}")
+        solutions.extend(data["solutions"])
+    if len(remote) == 1:
+        command, result = remote[0]
+        data = request_error_analysis(
+            _error_context(result), command, use_cache, refresh)
+    elif remote:
+        chars = ERROR_CONTEXT_CHARS // len(remote)
+        data = request_error_analysis(
+            "\n\n".join(f"Failing command: {command}\n"
+                        + _error_context(result, chars)
+                        for command, result in remote),
+            None, use_cache, refresh)
+    if remote:
+        telemetry().count(
+            "analysis." + ("cached" if "source" in data else "api"))
+        explanations.append(data["explanation"])
+        solutions.extend(data["solutions"])
+    return explanations, solutions
+
+
+def execute_parallel(commands, use_cache=True, refresh=False,
+                     jobs=PARALLEL_JOBS, on_result=None):
+    # Runs several commands at once, at most `jobs` at a time. Their output
+    # is streamed as lines labelled [n], and the exit code and wall time of
+    # each are listed when all have finished. The failures are analyzed
+    # together and a chosen fix runs through execute_command.
+    import concurrent.futures
+
+    lock = threading.Lock()
+    print()
+    for idx, command in enumerate(commands, 1):
+        print(f"\033[36m[{idx}]\033[0m {command}")
+    print(f"Running {len(commands)} commands, {min(jobs, len(commands))} "
+          "at a time")
+
+    def run(idx, command):
+        label = f"\033[36m[{idx}]\033[0m "
+        out = _LabeledLines(label, sys.stdout, lock)
+        err = _LabeledLines(label, sys.stderr, lock)
+        result = run_streaming(command, on_stdout=out, on_stderr=err)
+        out.flush()
+        err.flush()
+        if on_result is not None:
+            on_result(command, result)
+        return result
+
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        futures = [pool.submit(run, idx, command)
+                   for idx, command in enumerate(commands, 1)]
+    results = []
+    for command, future in zip(commands, futures):
+        try:
+            result = future.result()
+        except OSError as e:
+            result = CommandResult(127, "", str(e), 0.0, 0)
+        results.append((command, result))
+    elapsed = time.monotonic() - started
+    telemetry().add_time("execution", elapsed)
+    telemetry().count("parallel.commands", len(commands))
+
+    print("\nResults:")
+    for idx, (command, result) in enumerate(results, 1):
+        print(f"[{idx}] exit {result.returncode}, {result.elapsed:.2f}s  "
+              f"{command}")
+    print(f"Total: {elapsed:.2f}s wall time, "
+          f"{sum(result.elapsed for _, result in results):.2f}s if run "
+          "one after another")
+
+    failures = [(command, result) for command, result in results
+                if result.returncode != 0]
+    if not failures:
+        return True
+    try:
+        explanations, solutions = _analyze_failures(
+            failures, use_cache, refresh)
+    except Exception as e:
+        print(f"Error analysis failed: {e}")
+        return False
+    print("\nError Analysis:")
+    for explanation in explanations:
+        print(explanation)
+    solutions = [solution for solution in solutions
+                 if solution["command"] not in commands]
+    if not solutions:
+        return False
+    print("\nSuggested Solutions:")
+    for idx, solution in enumerate(solutions, 1):
+        print(f"{idx}. {solution['description']}")
+    with telemetry().timed("selection"):
+        selected_solution = display_and_select_solution(solutions)
+    if not selected_solution:
+        print("No solution selected.")
+        return False
+    telemetry().count("repairs")
+    return execute_command(selected_solution["command"], use_cache, refresh,
+                           on_result=on_result)
+
+
+def cache_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="groq-cli cache",
+        description="Show or clear the local response cache.",
+    )
+    parser.add_argument(
+        "--clear", action="store_true", help="Remove all cached responses")
+    args = parser.parse_args(argv)
+
+    cache = get_cache()
+    if args.clear:
+        cache.clear()
+        print("Cache cleared.")
+        return
+
+    print(f"Cache: {cache.path}")
+    stats = cache.stats()
+    if not stats:
+        print("No cache activity yet.")
+    for kind, counts in stats.items():
+        lookups = counts["hits"] + counts["misses"]
+        rate = counts["hits"] / lookups * 100 if lookups else 0.0
+        print(
+            f"{kind}: {counts['entries']} entries, {counts['hits']} hits, "
+            f"{counts['misses']} misses ({rate:.1f}% hit rate)"
+        )
+
+
+def _percentile(values, percent):
+    # Nearest-rank percentile of a sorted list
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def _percentile_columns(values):
+    values = sorted(values)
+    return "".join(f"{_percentile(values, p):9.3f}s" for p in (50, 95, 99))
+
+
+def _read_telemetry(path, since=None):
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if since is None or record["time"] >= since:
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+_STAGES = ["startup", "client", "daemon", "network", "first_token", "parse",
+           "response", "selection", "execution"]
+
+
+def stats_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="groq-cli stats",
+        description="Summarize the locally recorded latencies, token usage "
+        "and cache outcomes.",
+    )
+    parser.add_argument(
+        "--days", type=int, help="Only include the last DAYS days")
+    parser.add_argument(
+        "--clear", action="store_true", help="Delete the telemetry log")
+    args = parser.parse_args(argv)
+
+    path = telemetry_path()
+    if args.clear:
+        if os.path.exists(path):
+            os.unlink(path)
+        print("Telemetry log cleared.")
+        return
+
+    since = time.time() - args.days * 86400 if args.days else None
+    records = _read_telemetry(path, since)
+    print(f"Telemetry: {path}")
+    if not records:
+        print("No telemetry recorded yet.")
+        return
+    commands = {}
+    for record in records:
+        commands[record["command"]] = commands.get(record["command"], 0) + 1
+    print(f"{len(records)} invocations ("
+          + ", ".join(f"{n} {command}" for command, n in commands.items())
+          + ")")
+
+    by_model = {}
+    by_day = {}
+    for record in records:
+        day = time.strftime("%Y-%m-%d", time.localtime(record["time"]))
+        by_day.setdefault(day, [])
+        for call in record["calls"]:
+            by_model.setdefault(call["model"], []).append(call)
+            by_day[day].append(call)
+
+    header = (f"{'calls':>7}{'p50':>10}{'p95':>10}{'p99':>10}"
+              f"{'prompt tok':>12}{'output tok':>12}")
+    for title, groups in [("model", by_model), ("day", by_day)]:
+        width = max([len(title)] + [len(name) for name in groups])
+        print(f"\nAPI latency by {title}")
+        print(f"{title:<{width}}{header}")
+        for name, calls in sorted(groups.items()):
+            if not calls:
+                print(f"{name:<{width}}{0:>7}")
+                continue
+            print(
+                f"{name:<{width}}{len(calls):>7}"
+                + _percentile_columns([call["latency"] for call in calls])
+                + f"{sum(call.get('prompt_tokens', 0) for call in calls):>12}"
+                + f"{sum(call.get('completion_tokens', 0) for call in calls):>12}"
+            )
+
+    timings = {}
+    counters = {}
+    for record in records:
+        for name, seconds in record["timings"].items():
+            timings.setdefault(name, []).append(seconds)
+        for name, n in record["counters"].items():
+            counters[name] = counters.get(name, 0) + n
+    stages = [name for name in _STAGES if name in timings]
+    stages += sorted(set(timings) - set(_STAGES))
+    print("\nTime per invocation by stage")
+    print(f"{'stage':<12}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name in stages:
+        print(f"{name:<12}{len(timings[name]):>7}"
+              + _percentile_columns(timings[name]))
+
+    # One-shot queries count from the start of the process, shell turns from
+    # the line being entered
+    responses = {}
+    for record in records:
+        if "response" in record["timings"]:
+            responses.setdefault(record["command"], []).append(
+                record["timings"]["response"])
+    if responses:
+        print("\nTime until commands are shown, by command")
+        print(f"{'command':<12}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for name, seconds in sorted(responses.items()):
+            print(f"{name:<12}{len(seconds):>7}" + _percentile_columns(seconds))
+
+    routes = {}
+    for record in records:
+        for decision in record.get("routes", []):
+            counts = routes.setdefault(
+                (decision["kind"], decision["classified"]),
+                {"requests": 0, "escalated": 0, "scores": []})
+            counts["requests"] += 1
+            counts["escalated"] += decision["escalated"]
+            counts["scores"].append(decision["score"])
+    if routes:
+        print("\nRouting (classifier decision, escalations to the large model)")
+        print(f"{'kind':<10}{'route':<8}{'requests':>9}{'escalated':>11}"
+              f"{'score p50':>11}")
+        for (kind, route), counts in sorted(routes.items()):
+            scores = sorted(counts["scores"])
+            print(f"{kind:<10}{route:<8}{counts['requests']:>9}"
+                  f"{counts['escalated']:>11}{_percentile(scores, 50):>11.2f}")
+
+    if counters:
+        print("\nCounters")
+        for name, n in sorted(counters.items()):
+            print(f"{name}: {n}")
+
+
+def _cache_options():
+    # Parent parser of the commands that read and write the response cache
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the local response cache",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached responses and store fresh ones",
+    )
+    return parser
+
+
+def _hedge_options():
+    # Defaults to None, so that an option given on the command line can be
+    # told apart from GROQ_CLI_HEDGE and GROQ_CLI_HEDGE_MODEL
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--hedge",
+        type=float,
+        metavar="SECONDS",
+        help="Race a second request against one with no valid answer "
+        "after SECONDS (0 sends both at once)",
+    )
+    parser.add_argument(
+        "--hedge-model",
+        metavar="MODEL",
+        help="Model for the second request (default: the large model); "
+        "implies --hedge 0 unless a delay is given",
+    )
+    return parser
+
+
+def _jobs(value):
+    jobs = int(value)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return jobs
+
+
+def _jobs_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--jobs",
+        type=_jobs,
+        default=PARALLEL_JOBS,
+        metavar="N",
+        help="Run at most N of the marked commands at once "
+        f"(default: {PARALLEL_JOBS})",
+    )
+    return parser
+
+
+def _hedge_policy(args):
+    # Options given on the command line override the environment
+    delay = args.hedge if args.hedge is not None else HEDGE and HEDGE.delay
+    model = args.hedge_model or (HEDGE and HEDGE.model)
+    if delay is None and model is None:
+        return None
+    return HedgePolicy(delay or 0.0, model)
+
+
+def _read_batch_queries(lines):
+    # Yields (index, record) per non-blank line. A line is a JSON object with
+    # a "query" field, a JSON string, or plain text.
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = line
+        if not isinstance(record, dict):
+            record = {"query": record}
+        yield index, record
+
+
+def _resolve_batch_query(index, record, use_cache, refresh, similarity,
+                         hedge=HEDGE):
+    result = {"index": index}
+    if "id" in record:
+        result["id"] = record["id"]
+    query = record.get("query")
+    result["query"] = query
+    start = time.monotonic()
+    try:
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("Missing 'query' field")
+        data = get_commands(query, use_cache, refresh, similarity, hedge)
+        result.update(data)
+    except Exception as e:
+        result["error"] = str(e)
+    result["elapsed"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="groq-cli batch",
+        parents=[_cache_options(), _hedge_options()],
+        description="Resolve many queries concurrently and print one JSON "
+        "line per query in completion order.",
+    )
+    parser.add_argument(
+        "--input",
+        default="-",
+        help="JSONL file of queries, or '-' for stdin (default)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of queries in flight (default: 8)",
+    )
+    parser.add_argument(
+        "--similarity",
+        type=float,
+        default=SIMILARITY_THRESHOLD,
+        metavar="THRESHOLD",
+        help="Reuse commands from an earlier query at least this similar "
+        "(0-1, 0 disables)",
+    )
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    # Only batch mode needs the executor machinery
+    import concurrent.futures
+
+    infile = sys.stdin if args.input == "-" else open(args.input)
+    # Bounds both the requests in flight and the queries read ahead of them
+    slots = threading.BoundedSemaphore(args.concurrency)
+    output_lock = threading.Lock()
+
+    def emit(future):
+        slots.release()
+        line = json.dumps(future.result())
+        with output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    try:
+        with recording("batch"), \
+                concurrent.futures.ThreadPoolExecutor(args.concurrency) as pool:
+            for index, record in _read_batch_queries(infile):
+                slots.acquire()
+                future = pool.submit(
+                    _resolve_batch_query, index, record,
+                    not args.no_cache, args.refresh, args.similarity,
+                    _hedge_policy(args),
+                )
+                future.add_done_callback(emit)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+
+def _print_install_notes(selected):
+    for cmd in selected:
+        absent = missing_binaries(cmd["command"])
+        if absent and cmd.get("installation"):
+            print(f"\nNote: {', '.join(absent)} is not installed. "
+                  "Install it using:")
+            print(cmd["installation"])
+
+
+def _estimate_tokens(text):
+    # Close enough for budgeting: English and shell text average about four
+    # characters per token
+    return len(text) // 4 + 1
+
+
+class Session:
+    # The conversation of `groq-cli shell`. Each request sends the system
+    # prompt once, then the earlier turns: the query, the commands suggested
+    # (without descriptions) and the tail of what ran. The oldest turns are
+    # dropped once they add up to more than history_tokens.
+    def __init__(self, history_tokens=SESSION_HISTORY_TOKENS):
+        self.history_tokens = history_tokens
+        self.turns = []
+
+    def clear(self):
+        self.turns = []
+
+    def history(self):
+        messages = []
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["query"]})
+            messages.append({"role": "assistant", "content": turn["reply"]})
+            if turn["ran"]:
+                messages.append({
+                    "role": "user",
+                    "content": "Output of the commands I ran:\n\n"
+                    + "\n\n".join(turn["ran"]),
+                })
+        return messages
+
+    def messages(self, query):
+        return (_system_messages(COMMANDS_SYSTEM_PROMPT) + self.history()
+                + [{"role": "user", "content": query}])
+
+    def tokens(self):
+        return sum(_estimate_tokens(message["content"])
+                   for message in self.history())
+
+    def ask(self, query, use_cache=True, refresh=False,
+            similarity=SIMILARITY_THRESHOLD, hedge=HEDGE):
+        # Without history the answer depends on the query alone, so the
+        # cache applies; follow-ups always go to the API
+        if not self.turns:
+            data = get_commands(query, use_cache, refresh, similarity, hedge)
+        else:
+            data = fetch_commands(query, hedge, self.messages(query))
+        reply = json.dumps(
+            {"commands": [{"command": cmd["command"]}
+                          for cmd in data["commands"]]},
+            separators=(",", ":"))
+        self.turns.append({"query": query, "reply": reply, "ran": []})
+        self._trim()
+        return data
+
+    def add_result(self, command, result):
+        output = (result.stdout + result.stderr)[-SESSION_OUTPUT_CHARS:]
+        self.turns[-1]["ran"].append(
+            f"$ {command}\nExit code {result.returncode}\n{output.strip()}"
+            .strip())
+        self._trim()
+
+    def _trim(self):
+        # The latest turn is kept whatever its size: follow-ups mostly refer
+        # to it, and its output is already cut to SESSION_OUTPUT_CHARS
+        while len(self.turns) > 1 and self.tokens() > self.history_tokens:
+            self.turns.pop(0)
+
+
+def _warm_client():
+    # Errors, such as a missing API key, are raised by the first request
+    with contextlib.suppress(Exception):
+        get_client()
+
+
+def _shell_turn(session, query, record, use_cache, args):
+    started = time.perf_counter()
+    try:
+        data = session.ask(query, use_cache, args.refresh,
+                           hedge=_hedge_policy(args))
+    except Exception as e:
+        print(f"Failed to get valid commands: {e}")
+        return
+    record.add_time("response", time.perf_counter() - started)
+    with record.timed("selection"):
+        selected = display_and_select_command(
+            rank_by_availability(data["commands"]), multi=True)
+    if not selected:
+        print("No command selected.")
+        return
+    _print_install_notes(selected)
+    if len(selected) > 1:
+        execute_parallel([cmd["command"] for cmd in selected], use_cache,
+                         args.refresh, args.jobs, on_result=session.add_result)
+    else:
+        execute_command(selected[0]["command"], use_cache, args.refresh,
+                        on_result=session.add_result)
+
+
+def shell_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="groq-cli shell",
+        parents=[_cache_options(), _hedge_options(), _jobs_options()],
+        description="Ask for commands in a session that keeps one client "
+        "and remembers earlier queries and their output.",
+    )
+    parser.add_argument(
+        "--history-tokens",
+        type=int,
+        default=SESSION_HISTORY_TOKENS,
+        metavar="TOKENS",
+        help="Estimated tokens of earlier turns sent with each query "
+        f"(default: {SESSION_HISTORY_TOKENS})",
+    )
+    args = parser.parse_args(argv)
+    use_cache = not args.no_cache
+
+    try:
+        import readline  # noqa: F401  line editing and history for input()
+    except ImportError:
+        pass
+
+    # The client is built while the first query is typed
+    warm = threading.Thread(target=_warm_client, daemon=True)
+    warm.start()
+    session = Session(args.history_tokens)
+    startup = time.perf_counter() - _PROCESS_STARTED
+    print("groq-cli shell. Follow-up queries can refer to earlier commands "
+          "and their output.\n'reset' forgets them, 'exit' or Ctrl-D quits.")
+    while True:
+        try:
+            query = input("groq> ").strip()
+        except EOFError:
+            print()
+            return
+        except KeyboardInterrupt:
+            print()
+            continue
+        if not query:
+            continue
+        if query in ("exit", "quit"):
+            return
+        if query == "reset":
+            session.clear()
+            print("Session history cleared.")
+            continue
+
+        with recording("shell") as record:
+            if startup is not None:
+                record.add_time("startup", startup)
+                startup = None
+            warm.join()
+            try:
+                _shell_turn(session, query, record, use_cache, args)
+            except KeyboardInterrupt:
+                print("\nInterrupted.")
+
+
+SUBCOMMANDS = {
+    "batch": batch_main,
+    "cache": cache_main,
+    "daemon": daemon_main,
+    "shell": shell_main,
+    "stats": stats_main,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[argv[0]](argv[1:])
+    return query_main(argv)
+
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(
+        parents=[_cache_options(), _hedge_options(), _jobs_options()],
+        description="CLI tool for generating commands using Groq.",
+        epilog="Subcommands: " + ", ".join(SUBCOMMANDS)
+        + ". Use '--' before a query that starts with a subcommand name.",
+    )
+    parser.add_argument(
+        "query",
+        nargs="+",
+        help="The operation you want to perform")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Show commands as they are generated instead of waiting for the full response",
+    )
+    parser.add_argument(
+        "--similarity",
+        type=float,
+        default=SIMILARITY_THRESHOLD,
+        metavar="THRESHOLD",
+        help="Reuse commands from an earlier query at least this similar "
+        f"(0-1, 0 disables, default: {SIMILARITY_THRESHOLD})",
+    )
+    args = parser.parse_args(argv)
+    # Streamed commands come from a single request, which is never hedged
+    if args.stream and (args.hedge is not None or args.hedge_model):
+        parser.error("--hedge and --hedge-model cannot be used with --stream")
+
+    # Only queries that get this far are recorded, not --help or bad usage
+    with recording("query") as record:
+        record.add_time("startup", time.perf_counter() - _PROCESS_STARTED)
+        _run_query(args)
+
+
+def _run_query(args):
+    query = " ".join(args.query)
+    use_cache = not args.no_cache
+    cached = None
+    if args.stream and use_cache and not args.refresh:
+        cached = lookup_commands(query, args.similarity)
+
+    if args.stream and cached is None:
+        on_complete = None
+        if use_cache:
+            def on_complete(data):
+                remember_commands(query, data)
+        stream = CommandStream(query, on_complete=on_complete).start()
+        with telemetry().timed("selection"):
+            selected = display_and_select_command(
+                [], stream=stream, multi=True)
+        if stream.error is not None and not stream.commands:
+            print(f"Failed to get valid commands: {stream.error}")
+            return
+        print(stream.timing_summary())
+    else:
+        result = cached
+        if result is None:
+            result = request_commands(
+                query, use_cache, args.refresh, args.similarity,
+                _hedge_policy(args))
+
+        if result is None:
+            print("Failed to get valid commands. Please try again.")
+            return
+        telemetry().add_time(
+            "response", time.perf_counter() - _PROCESS_STARTED)
+
+        note = None
+        if "reused_from" in result:
+            reused = result["reused_from"]
+            note = (
+                f"Reusing commands from the similar query '{reused['query']}' "
+                f"(similarity {reused['similarity']:.2f}). "
+                "Use --refresh to ask the API instead."
+            )
+        with telemetry().timed("selection"):
+            selected = display_and_select_command(
+                rank_by_availability(result["commands"]), note=note,
+                multi=True)
+
+    if selected and len(selected) > 1:
+        _print_install_notes(selected)
+        execute_parallel([cmd["command"] for cmd in selected], use_cache,
+                         args.refresh, args.jobs)
+        return
+    selected_command = selected[0] if selected else None
+    if selected_command:
+        absent = missing_binaries(selected_command["command"])
+        if absent and "installation" in selected_command:
+            print(f"\nNote: {', '.join(absent)} is not installed. Install it using:")
+            print(selected_command["installation"])
+        success = execute_command(
+            selected_command["command"], use_cache, args.refresh)
+        if not success and not absent and "installation" in selected_command:
             print(
                 f"\nNote: If the command is not found, you may need to install it using:"
             )
@@ -1,5 +1,6 @@
 import sys
 import os
+import pytest
 
 sys.path.insert(
     0,
@@ -7,3 +8,10 @@ sys.path.insert(
         os.path.join(
             os.path.dirname(__file__),
             "..")))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    # Keep the response cache out of the user's home directory
+    monkeypatch.setenv("GROQ_CLI_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
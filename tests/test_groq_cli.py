@@ -1,16 +1,65 @@
 import pytest
 import json
+import os
+import random
+import socket
+import sys
+import subprocess
+import threading
+import time
 from unittest.mock import patch, MagicMock
 from groq_cli import (
     get_commands,
     handle_error,
     execute_command,
+    run_streaming,
+    TailBuffer,
+    CommandArrayParser,
+    CommandStream,
+    classify_request,
+    extract_json,
+    ResponseCache,
+    QueryIndex,
+    lookup_commands,
+    remember_commands,
+    get_cache,
+    batch_main,
+    request_commands,
+    _create_completion,
+    get_client,
+    HedgePolicy,
+    triage_error,
+    normalize_error,
+    get_host_info,
+    host_context,
+    PathIndex,
+    COMMANDS_SYSTEM_PROMPT,
+    Session,
+    execute_parallel,
+    shell_main,
+    Selector,
+    fuzzy_score,
+    parse_keys,
+    command_binaries,
+    rank_by_availability,
+    recording,
+    main,
+    stats_main,
+    telemetry_path,
+    register_error_rule,
+    ERROR_RULES,
+    _DaemonHandler,
+    daemon_main,
+    _DaemonServer,
+    SIMILARITY_THRESHOLD,
 )
+from benchmarks.stub_server import Reply, StubServer
 
 
 # Mock the Groq client for testing
-@patch("groq_cli.client.chat.completions.create")
-def test_get_commands(mock_create):
+@patch("groq_cli.get_client")
+def test_get_commands(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
     mock_create.return_value = MagicMock(
         choices=[
             MagicMock(
@@ -35,8 +84,9 @@ def test_get_commands(mock_create):
     assert "installation" in result["commands"][0]
 
 
-@patch("groq_cli.client.chat.completions.create")
-def test_handle_error(mock_create):
+@patch("groq_cli.get_client")
+def test_handle_error(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
     mock_create.return_value = MagicMock(
         choices=[
             MagicMock(
@@ -62,18 +112,1002 @@ def test_handle_error(mock_create):
     assert "command" in result["solutions"][0]
 
 
-@patch("subprocess.run")
-def test_execute_command(mock_run):
-    mock_run.return_value = MagicMock(
-        stdout="Output of the command", returncode=0)
-
-    command = "ls -la"
+def test_execute_command(capfd):
+    command = "echo 'Output of the command'"
     success = execute_command(command)
 
     assert success is True
-    mock_run.assert_called_once_with(
-        ["bash", "-c", command], check=True, text=True, capture_output=True
+    assert "Output of the command" in capfd.readouterr().out
+
+
+def test_run_streaming_keeps_bounded_tail():
+    chunks = []
+    result = run_streaming(
+        "head -c 1000000 /dev/zero | tr '\\0' x; echo oops >&2; exit 3",
+        on_stdout=chunks.append,
+        on_stderr=lambda data: None,
+        tail_bytes=1024,
+    )
+
+    assert result.returncode == 3
+    assert sum(len(chunk) for chunk in chunks) == 1000000
+    assert result.stdout == "x" * 1024
+    assert result.stderr == "oops\n"
+    assert result.peak_buffered <= 2 * 1024
+    assert result.elapsed > 0
+
+
+def test_tail_buffer():
+    tail = TailBuffer(4)
+    tail.write(b"ab")
+    tail.write(b"cdef")
+    assert tail.getvalue() == b"cdef"
+    tail.write(b"0123456789")
+    assert tail.getvalue() == b"6789"
+    assert tail.total == 16
+
+
+def test_command_array_parser_emits_objects_as_they_close():
+    response = json.dumps(
+        {
+            "commands": [
+                {"command": "du -sh *", "description": "Sizes {per} dir"},
+                {"command": "echo \\\"}\\\"", "description": "Quoted"},
+            ]
+        }
+    )
+    parser = CommandArrayParser()
+    seen = []
+    for idx in range(0, len(response), 7):
+        seen.extend(parser.feed(response[idx:idx + 7]))
+        if len(seen) == 1:
+            # The first command is available before the response is complete
+            assert idx + 7 < len(response)
+
+    assert [item["command"] for item in seen] == ["du -sh *", 'echo \\"}\\"']
+    assert parser.closed
+
+
+@patch("groq_cli._create_completion")
+def test_command_stream(mock_create):
+    response = json.dumps(
+        {"commands": [{"command": "ls", "description": "List"},
+                      {"command": "df -h", "description": "Disk"}]}
+    )
+    chunks = [response[i:i + 5] for i in range(0, len(response), 5)]
+    mock_create.return_value = [
+        MagicMock(choices=[MagicMock(delta=MagicMock(content=chunk))])
+        for chunk in chunks
+    ]
+
+    stream = CommandStream("list files").start().wait(5)
+
+    assert stream.error is None
+    assert [cmd["command"] for cmd in stream.commands] == ["ls", "df -h"]
+    assert stream.first_command_time <= stream.total_time
+    mock_create.assert_called_once()
+    assert mock_create.call_args.kwargs["stream"] is True
+
+
+@patch("groq_cli.get_client")
+def test_get_commands_uses_cache(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
+    mock_create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(
+            content=json.dumps({"commands": [{"command": "df -h"}]})))])
+
+    first = get_commands("Disk usage?")
+    second = get_commands("  disk   USAGE ")
+    refreshed = get_commands("disk usage", refresh=True)
+    get_commands("disk usage", use_cache=False)
+
+    assert first == second == refreshed
+    assert mock_create.call_count == 3
+    assert get_cache().stats()["commands"] == {
+        "hits": 1, "misses": 1, "entries": 1}
+
+    # Another configured model can answer differently
+    with patch.dict("groq_cli.MODELS", small="llama-3.2-3b-preview"):
+        get_commands("disk usage")
+    assert mock_create.call_count == 4
+
+
+def test_response_cache_ttl_and_lru(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put("commands", "a", {"n": 1})
+    cache.put("commands", "b", {"n": 2})
+    cache.put("commands", "expired", {"n": 0}, ttl=-1)
+    assert cache.get("commands", "expired") is None
+    assert cache.get("commands", "a") == {"n": 1}  # a is now most recent
+    cache.put("commands", "c", {"n": 3})
+
+    assert cache.get("commands", "b") is None
+    assert cache.get("commands", "a") == {"n": 1}
+    assert cache.get("commands", "c") == {"n": 3}
+    assert cache.stats()["commands"]["entries"] == 2
+
+
+@patch("groq_cli.get_client")
+def test_get_commands_reuses_similar_query(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
+    mock_create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(
+            content=json.dumps({"commands": [{"command": "du -sh */"}]})))])
+
+    get_commands("show disk usage per folder")
+    reused = get_commands("disk usage for each directory")
+    fresh = get_commands("who is listening on port 8080")
+
+    assert mock_create.call_count == 2
+    assert reused["commands"] == [{"command": "du -sh */"}]
+    assert reused["reused_from"]["query"] == "show disk usage per folder"
+    assert reused["reused_from"]["similarity"] >= 0.75
+    assert "reused_from" not in fresh
+    assert get_cache().stats()["similar"]["hits"] == 1
+
+
+def test_similar_query_needs_the_same_action():
+    find = {"commands": [
+        {"command": "find /var/log -type f -mtime +30 -delete"}]}
+    remember_commands("delete files older than 30 days in /var/log", find)
+    assert lookup_commands("list files older than 30 days in /var/log") is None
+    # Same action, but the suggestion deletes files: exact queries only
+    assert lookup_commands("delete files older than 7 days in /var/log") is None
+    assert lookup_commands(
+        "delete files older than 30 days in /var/log") == find
+
+    listing = {"commands": [{"command": "find /var/log -type f -mtime +30"}]}
+    remember_commands("list files older than 30 days in /var/log", listing)
+    reused = lookup_commands("show files older than 30 days in /var/log")
+    assert reused["commands"] == listing["commands"]
+    assert lookup_commands("compress files older than 30 days in /var/log") \
+        is None
+
+
+def test_query_index_persists(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    QueryIndex(path).add("find large files in home", {"commands": []})
+
+    index = QueryIndex(path)
+    assert len(index) == 1
+    score, query, data = index.lookup("find the large files in home", 0.75)
+    assert query == "find large files in home"
+    assert data == {"commands": []}
+    assert index.lookup("restart nginx", 0.75) is None
+
+    # The oldest entries go first, whatever their scope
+    other = QueryIndex(path, scope="other host", max_entries=2)
+    other.add("show open ports", {"commands": []})
+    other.add("count lines in every log file", {"commands": []})
+    assert len(index) == 0
+    assert len(other) == 2
+
+
+@patch("groq_cli.get_commands")
+def test_batch_main(mock_get_commands, tmp_path, capsys):
+    def fake_get_commands(query, *args):
+        if query == "fail":
+            raise ValueError("Invalid response structure")
+        return {"commands": [{"command": f"echo {query}"}]}
+
+    mock_get_commands.side_effect = fake_get_commands
+    infile = tmp_path / "queries.jsonl"
+    infile.write_text(
+        '{"query": "one", "id": "a"}\n\n"two"\nthree\n{"query": "fail"}\n')
+
+    batch_main(["--input", str(infile), "--concurrency", "2"])
+
+    results = [json.loads(line)
+               for line in capsys.readouterr().out.splitlines()]
+    by_index = {result["index"]: result for result in results}
+    assert sorted(by_index) == [0, 2, 3, 4]
+    assert by_index[0]["id"] == "a"
+    assert by_index[0]["commands"] == [{"command": "echo one"}]
+    assert by_index[3]["query"] == "three"
+    assert by_index[4]["error"] == "Invalid response structure"
+
+
+@patch("groq_cli.time.sleep")
+@patch("groq_cli.get_client")
+def test_create_completion_backs_off_on_rate_limit(mock_get_client, mock_sleep):
+    mock_create = mock_get_client.return_value.chat.completions.create
+    rate_limited = Exception("rate limited")
+    rate_limited.status_code = 429
+    rate_limited.response = MagicMock(headers={"retry-after": "2"})
+    mock_create.side_effect = [rate_limited, rate_limited, "completion"]
+
+    assert _create_completion([]) == "completion"
+    assert mock_create.call_count == 3
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [2.0, 2.0]
+
+
+def test_import_does_not_load_sdk():
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, groq_cli; print('groq' in sys.modules)"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={k: v for k, v in os.environ.items() if k != "GROQ_API_KEY"},
+        capture_output=True, text=True, check=True,
     )
+    assert result.stdout.strip() == "False"
+
+
+@patch("groq_cli.get_commands")
+def test_request_commands_via_daemon(mock_get_commands, tmp_path, monkeypatch):
+    path = str(tmp_path / "daemon.sock")
+    monkeypatch.setenv("GROQ_CLI_SOCKET", path)
+    mock_get_commands.return_value = {"commands": [{"command": "ss -ltnp"}]}
+
+    server = _DaemonServer(path, _DaemonHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        result = request_commands("who listens on port 22", refresh=True)
+        mock_get_commands.side_effect = ValueError("Invalid response structure")
+        with pytest.raises(ValueError, match="Invalid response structure"):
+            request_commands("broken")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert result == {"commands": [{"command": "ss -ltnp"}]}
+    mock_get_commands.assert_any_call(
+        "who listens on port 22", True, True, SIMILARITY_THRESHOLD, None)
+
+
+@patch("groq_cli.get_commands")
+def test_request_commands_without_daemon(mock_get_commands, tmp_path,
+                                         monkeypatch):
+    monkeypatch.setenv("GROQ_CLI_SOCKET", str(tmp_path / "missing.sock"))
+    mock_get_commands.return_value = {"commands": []}
+
+    assert request_commands("anything") == {"commands": []}
+    mock_get_commands.assert_called_once()
+
+
+@patch("groq_cli.get_commands")
+def test_request_commands_with_hung_daemon(mock_get_commands, tmp_path,
+                                           monkeypatch):
+    # A daemon that accepts connections but never answers
+    path = str(tmp_path / "daemon.sock")
+    monkeypatch.setenv("GROQ_CLI_SOCKET", path)
+    monkeypatch.setattr("groq_cli.DAEMON_TIMEOUT", 0.2)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    mock_get_commands.return_value = {"commands": []}
+    try:
+        assert request_commands("anything") == {"commands": []}
+    finally:
+        server.close()
+    mock_get_commands.assert_called_once()
+
+
+def test_daemon_keeps_files_that_are_not_sockets(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("keep me")
+    with pytest.raises(SystemExit):
+        daemon_main(["--socket", str(path)])
+    assert path.read_text() == "keep me"
+
+
+def test_triage_error_matches_local_rules():
+    result = triage_error(
+        "bash: line 1: speedtest-cli: command not found\n", "speedtest-cli")
+    assert result["source"] == "local rule: command-not-found"
+    assert "speedtest-cli" in result["explanation"]
+    assert any(solution["command"] ==
+               "sudo apt-get update && sudo apt-get install speedtest-cli"
+               for solution in result["solutions"])
+
+    result = triage_error(
+        "ls: cannot open directory '/root/my dir': Permission denied",
+        "ls '/root/my dir'")
+    commands = [solution["command"] for solution in result["solutions"]]
+    assert commands == ["sudo bash -c 'ls '\"'\"'/root/my dir'\"'\"''",
+                        "ls -ld '/root/my dir'"]
+
+    result = triage_error("cat: notes.txt: No such file or directory",
+                          "cat notes.txt")
+    assert "find ~ -name \"$(basename notes.txt)\" 2>/dev/null" in [
+        solution["command"] for solution in result["solutions"]]
+    # GNU coreutils quotes paths like this in UTF-8 locales
+    result = triage_error(
+        "ls: cannot access ‘/proc/foo bar’: No such file or directory",
+        "ls '/proc/foo bar'")
+    assert result["explanation"] == ("A file or directory the command needs "
+                                     "(/proc/foo bar) does not exist.")
+    assert result["solutions"][0]["command"] == (
+        "ls -la \"$(dirname '/proc/foo bar')\"")
+    # A solution needing a value the error doesn't contain is left out
+    result = triage_error("bash: line 1: Permission denied", "./run")
+    assert [solution["command"] for solution in result["solutions"]] == [
+        "sudo bash -c ./run"]
+    assert triage_error("No such file or directory", "make") is None
+
+    assert triage_error("git@github.com: Permission denied (publickey).\n"
+                        "fatal: Could not read from remote repository.",
+                        "git push") is None
+    assert triage_error("git@github.com: Permission denied (publickey).",
+                        "git push") is None
+    assert triage_error("Error: not found", "helm pull foo") is None
+    # The details pattern doesn't match, so no generic answer
+    assert triage_error("zsh: command not found: foo", "foo") is None
+    # Only the final line is the failure
+    assert triage_error(
+        "warning: /etc/app.conf: No such file or directory, using defaults\n"
+        "error: database is locked", "app migrate") is None
+    assert triage_error("segfault in libfoo", "foo") is None
+    assert triage_error("", "true") is None
+
+
+def test_register_error_rule(monkeypatch):
+    monkeypatch.setattr("groq_cli.ERROR_RULES", list(ERROR_RULES))
+    monkeypatch.setattr("groq_cli._compiled_rules", None)
+    register_error_rule(
+        "custom",
+        r"jammed",
+        "Widget {name} is jammed.",
+        [{"description": "Unjam {name}", "command": "unjam {name}"}],
+        details=r"widget (?P<name>\w+) jammed",
+    )
+
+    result = triage_error("error: widget gear jammed", "run")
+    assert result["explanation"] == "Widget gear is jammed."
+    assert result["solutions"] == [
+        {"description": "Unjam gear", "command": "unjam gear"}]
+
+
+@patch("groq_cli.request_error_analysis")
+@patch("groq_cli.display_and_select_solution", return_value=None)
+def test_execute_command_triages_locally(mock_select, mock_analysis, capfd):
+    assert execute_command("no-such-program-xyz") is False
+
+    mock_analysis.assert_not_called()
+    assert "local rule: command-not-found" in capfd.readouterr().out
+
+
+def test_normalize_error_masks_variable_parts():
+    first = normalize_error(
+        "2024-05-01T10:22:33Z nginx[1234]: open() \"/var/www/a/index.html\" "
+        "failed (13: Permission denied), client: 10.0.0.5:53422")
+    second = normalize_error(
+        "2024-06-11T08:01:02Z nginx[77]: open() \"/srv/b/index.html\" "
+        "failed (13: Permission denied), client: 192.168.1.20:40000")
+
+    assert first == second
+    assert first == ("<time> nginx[<n>]: open() \"<path>\" failed "
+                     "(<n>: Permission denied), client: <ip>")
+    assert normalize_error("container 3f4e9a8b7c6d5e4f at 0xdeadbeef") == (
+        "container <hex> at <hex>")
+
+
+@patch("groq_cli.get_client")
+def test_handle_error_cached_by_fingerprint(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
+    mock_create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content=json.dumps(
+            {"explanation": "Port in use.",
+             "solutions": [{"description": "Find it",
+                            "command": "ss -ltnp"}]})))])
+
+    first = handle_error("Exit code 1\nbind 10.0.0.1:8080 failed, pid 4242",
+                         command="serve --port 8080")
+    second = handle_error("Exit code 1\nbind 10.0.0.9:9090 failed, pid 17",
+                          command="serve --port 9090")
+
+    assert mock_create.call_count == 1
+    messages = mock_create.call_args.kwargs["messages"]
+    assert "Failing command: serve --port 8080" in messages[-1]["content"]
+    assert "pid 4242" in messages[-1]["content"]
+    assert "source" not in first
+    assert second["source"].startswith("cached analysis of error")
+    assert second["solutions"] == first["solutions"]
+    assert get_cache().stats()["error"]["hits"] == 1
+
+
+@patch("groq_cli.display_and_select_solution",
+       side_effect=lambda solutions: solutions[0])
+@patch("groq_cli.request_error_analysis")
+def test_repair_loop_reuses_analysis_and_skips_tried(mock_analysis,
+                                                     mock_select, capfd):
+    mock_analysis.return_value = {
+        "explanation": "It fails.",
+        "solutions": [
+            {"description": "Retry", "command": "exit 7"},
+            {"description": "Other", "command": "exit 8"},
+            {"description": "Third", "command": "exit 9"},
+        ],
+        "usage": {"prompt_tokens": 90, "completion_tokens": 10},
+    }
+
+    assert execute_command("exit 7") is False
+
+    # "exit 8" and "exit 9" fail the same way, so the first analysis is
+    # reused and the already-tried commands are never offered again
+    mock_analysis.assert_called_once()
+    offered = [call.args[0] for call in mock_select.call_args_list]
+    assert [s["command"] for s in offered[0]] == ["exit 8", "exit 9"]
+    assert [s["command"] for s in offered[1]] == ["exit 9"]
+    out = capfd.readouterr().out
+    assert "All suggested solutions have already been tried." in out
+    assert "Total: 3 attempts" in out
+    assert "100 tokens" in out
+
+
+@patch("groq_cli.display_and_select_solution",
+       side_effect=lambda solutions: solutions[0])
+@patch("groq_cli.request_error_analysis")
+def test_repair_loop_respects_budgets(mock_analysis, mock_select, capfd):
+    words = iter(["beta", "gamma", "delta", "epsilon"])
+    mock_analysis.side_effect = lambda *args: {
+        "explanation": "Try the next word.",
+        "solutions": [{"description": "Next",
+                       "command": f"echo {next(words)} >&2; exit 1"}],
+        "usage": {"prompt_tokens": 50, "completion_tokens": 50},
+    }
+
+    assert execute_command("echo alpha >&2; exit 1", max_attempts=2) is False
+    assert mock_analysis.call_count == 2
+    assert "Stopping after 2 repair attempts." in capfd.readouterr().out
+
+    mock_analysis.reset_mock()
+    assert execute_command("echo alpha >&2; exit 1", token_budget=150) is False
+    assert mock_analysis.call_count == 2
+    assert "token budget of 150 used up" in capfd.readouterr().out
+
+
+@patch("groq_cli.probe_host")
+def test_host_info_cached_until_probe_key_changes(mock_probe, monkeypatch,
+                                                  isolated_cache):
+    mock_probe.return_value = {
+        "os": "Ubuntu 22.04.4 LTS", "id": "ubuntu", "like": "debian",
+        "package_manager": "apt-get", "shell": "bash", "root": False,
+        "sudo": True, "tools": ["curl", "git"], "missing": ["jq"],
+    }
+    monkeypatch.setattr("groq_cli._host_infos", {})
+    monkeypatch.setenv("SHELL", "/bin/bash")
+    get_host_info()
+    # A new process reads host.json instead of probing
+    monkeypatch.setattr("groq_cli._host_infos", {})
+    context = host_context()
+    assert mock_probe.call_count == 1
+
+    assert context.startswith(
+        "Target machine: Ubuntu 22.04.4 LTS; package manager: apt-get; "
+        "shell: bash; non-root user with sudo; installed: curl, git; "
+        "not installed: jq.")
+
+    # A long-running process notices the change on its next recheck
+    monkeypatch.setenv("SHELL", "/usr/bin/zsh")
+    get_host_info()
+    assert mock_probe.call_count == 1
+    monkeypatch.setattr("groq_cli.HOST_RECHECK", 0)
+    get_host_info()
+    assert mock_probe.call_count == 2
+
+    # An unwritable host.json costs a probe, not the request
+    os.unlink(isolated_cache / "host.json")
+    os.mkdir(isolated_cache / "host.json")
+    monkeypatch.setenv("SHELL", "/bin/sh")
+    assert get_host_info()["os"] == "Ubuntu 22.04.4 LTS"
+    assert mock_probe.call_count == 3
+
+
+@patch("groq_cli.host_context", return_value="Target machine: Arch Linux")
+@patch("groq_cli.get_client")
+def test_get_commands_sends_host_context(mock_get_client, mock_context):
+    mock_create = mock_get_client.return_value.chat.completions.create
+    mock_create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(
+            content=json.dumps({"commands": [{"command": "pacman -Qi"}]})))])
+
+    get_commands("list installed packages")
+
+    messages = mock_create.call_args.kwargs["messages"]
+    assert [m["role"] for m in messages] == ["system", "system", "user"]
+    assert messages[1]["content"] == "Target machine: Arch Linux"
+
+
+def test_command_binaries_parses_pipelines_and_chains():
+    assert command_binaries(
+        "FOO=1 sudo -u www-data du -sh /var/www | sort -h && echo done"
+    ) == ["sudo", "du", "sort"]
+    assert command_binaries(
+        "for f in *.log; do gzip $f; done > /dev/null 2>&1") == ["gzip"]
+    assert command_binaries("timeout 5 ping -c 1 host || cd /tmp") == [
+        "timeout", "ping"]
+    assert command_binaries("echo 'unterminated") == []
+
+
+def test_path_index_rescans_only_changed_directories(tmp_path):
+    bin_a, bin_b = tmp_path / "a", tmp_path / "b"
+    for directory, name in [(bin_a, "jq"), (bin_b, "htop")]:
+        directory.mkdir()
+        (directory / name).write_text("#!/bin/sh\n")
+        (directory / name).chmod(0o755)
+    (bin_a / "README").write_text("not executable")
+    search_path = os.pathsep.join([str(bin_a), str(bin_b)])
+    index_file = str(tmp_path / "path_index.json")
+
+    index = PathIndex(index_file).refresh(search_path)
+    assert "jq" in index and "htop" in index and "README" not in index
+
+    (bin_b / "ncdu").write_text("#!/bin/sh\n")
+    (bin_b / "ncdu").chmod(0o755)
+    os.utime(bin_b, ns=(0, 1))
+    index = PathIndex(index_file)
+    with patch.object(PathIndex, "_scan", wraps=PathIndex._scan) as scan:
+        index.refresh(search_path)
+    scan.assert_called_once_with(str(bin_b))
+    assert "ncdu" in index and "jq" in index
+
+
+@patch("groq_cli.missing_binaries", side_effect=lambda command, index: (
+    ["speedtest-cli"] if "speedtest" in command else []))
+def test_rank_by_availability(mock_missing):
+    commands = [{"command": "speedtest-cli"}, {"command": "ping -c 4 8.8.8.8"},
+                {"command": "curl -o /dev/null https://example.com"}]
+    assert [cmd["command"] for cmd in rank_by_availability(commands)] == [
+        "ping -c 4 8.8.8.8", "curl -o /dev/null https://example.com",
+        "speedtest-cli"]
+
+
+@patch("groq_cli.get_client")
+def test_recording_logs_calls_tokens_and_cache(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
+    mock_create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(
+            content=json.dumps({"commands": [{"command": "df -h"}]})))],
+        usage=MagicMock(prompt_tokens=420, completion_tokens=35),
+    )
+
+    with recording("query"):
+        get_commands("check disk space")
+    with recording("query"):
+        get_commands("check disk space")
+
+    with open(telemetry_path()) as f:
+        first, second = [json.loads(line) for line in f]
+    assert first["command"] == "query"
+    assert [(call["model"], call["prompt_tokens"], call["completion_tokens"])
+            for call in first["calls"]] == [("llama-3.1-8b-instant", 420, 35)]
+    assert first["routes"] == [{"kind": "commands", "route": "small",
+                                "score": 0, "classified": "small",
+                                "escalated": False}]
+    assert {"network", "parse"} <= set(first["timings"])
+    assert first["counters"]["cache.commands.misses"] == 1
+    assert second["calls"] == []
+    assert second["counters"] == {"cache.commands.hits": 1}
+
+
+def test_main_records_only_parsed_queries(capsys):
+    for argv in (["--help"], ["--jobs", "0", "list files"], []):
+        with pytest.raises(SystemExit):
+            main(argv)
+    assert not os.path.exists(telemetry_path())
+
+
+def test_main_rejects_hedging_a_stream(capsys):
+    with pytest.raises(SystemExit):
+        main(["--stream", "--hedge-model", "llama-3.1-70b-versatile", "ls"])
+    assert "cannot be used with --stream" in capsys.readouterr().err
+
+
+def test_stats_main_reports_percentiles(capsys):
+    day = 1791331200  # 2026-10-07 UTC
+    with open(telemetry_path(), "w") as f:
+        for i in range(1, 101):
+            f.write(json.dumps({
+                "time": day + 3600 * 12 + i, "command": "query",
+                "timings": {"network": i / 100, "selection": 2.0},
+                "counters": {"cache.commands.misses": 1},
+                "calls": [{"model": "llama-3.1-70b-versatile",
+                           "latency": i / 100, "prompt_tokens": 400,
+                           "completion_tokens": 50}],
+            }) + "\n")
+        f.write('{"time": 17913')  # cut short by a crash
+
+    stats_main([])
+
+    out = capsys.readouterr().out
+    assert "100 invocations (100 query)" in out
+    assert ("llama-3.1-70b-versatile    100    0.500s    0.950s    0.990s"
+            "       40000        5000") in out
+    assert "2026-10-07" in out
+    assert "selection       100    2.000s    2.000s    2.000s" in out
+    assert "cache.commands.misses: 100" in out
+
+
+# Responses json.loads() rejects, as models return them, and what should
+# be recovered from each
+BROKEN_RESPONSES = [
+    ('Here are the commands:\n```json\n{"commands": [{"command": "df -h"}]}\n'
+     '```\nLet me know if you need more.',
+     {"commands": [{"command": "df -h"}]}),
+    ('{"commands": [{"command": "grep -E \'\\d+\\.\\d+\' log", '
+     '"description": "Find versions"}]}',
+     {"commands": [{"command": "grep -E '\\d+\\.\\d+' log",
+                    "description": "Find versions"}]}),
+    ('{"commands": [{"command": "find . -name \\*.tmp -delete",},]}',
+     {"commands": [{"command": "find . -name \\*.tmp -delete"}]}),
+    ('{"commands": [{"command": "printf \'a\tb\'", "description": "Tab\n'
+     'separated"}]}',
+     {"commands": [{"command": "printf 'a\tb'",
+                    "description": "Tab\nseparated"}]}),
+    ('{"commands": [{"command": "ls -la", "description": "List"}, '
+     '{"command": "du -sh *", "descrip',
+     {"commands": [{"command": "ls -la", "description": "List"}]}),
+    ('{"explanation": "The path C:\\Temp is Windows-style.", "solutions": ['
+     '{"command": "cd /tmp", "description": "Use a Linux path"}, {"comm',
+     {"explanation": "The path C:\\Temp is Windows-style.",
+      "solutions": [{"command": "cd /tmp",
+                     "description": "Use a Linux path"}]}),
+    ('{"commands": [{"command": "echo \\u00e9"}]] trailing',
+     {"commands": [{"command": "echo \u00e9"}]}),
+]
+
+
+def test_extract_json_recovers_broken_responses():
+    for text, expected in BROKEN_RESPONSES:
+        assert extract_json(text) == expected, text
+    with pytest.raises(ValueError):
+        extract_json("I cannot help with that.")
+
+
+def test_extract_json_fuzz():
+    doc = {"commands": [
+        {"command": "find /var/log -name '*.gz' -mtime +30 -delete",
+         "description": "Delete \"old\" logs", "installation": ""},
+        {"command": "grep -rn 'TODO' . | wc -l", "description": "Count",
+         "installation": ""},
+        {"command": "awk '{print $1}' access.log | sort | uniq -c",
+         "description": "Requests per IP", "installation": ""},
+    ]}
+    text = json.dumps(doc, indent=2)
+
+    # A response cut off anywhere keeps exactly the commands that completed
+    for cut in range(1, len(text)):
+        commands = extract_json(text[:cut]).get("commands", [])
+        assert commands == doc["commands"][:len(commands)], text[:cut]
+    # Backslashes the model forgot to escape are kept literally
+    doc["commands"][0]["command"] = r"grep -P '\d{3}-\w+' notes.txt"
+    unescaped = json.dumps(doc).replace("\\\\", "\\")
+    assert extract_json(unescaped) == doc
+
+    # Random corruption never raises anything but ValueError
+    rng = random.Random(1234)
+    for _ in range(3000):
+        chars = list(text)
+        for _ in range(rng.randint(1, 6)):
+            i = rng.randrange(len(chars))
+            if rng.random() < 0.5:
+                del chars[i]
+            else:
+                chars.insert(i, rng.choice('{}[],:"\\\n\tx1 '))
+        try:
+            result = extract_json("".join(chars)[:rng.randrange(len(chars))])
+        except ValueError:
+            continue
+        assert isinstance(result, dict)
+
+
+def test_classify_request():
+    assert classify_request("list files by size")["route"] == "small"
+    assert classify_request("check disk space")["route"] == "small"
+    decision = classify_request(
+        "find log files older than a week, compress each one and then "
+        "delete the originals")
+    assert decision["route"] == "large"
+    assert decision["steps"] == ["each", "then"]
+    assert classify_request("open port 443 with iptables")["domains"] == [
+        "iptables"]
+    traceback = "Traceback (most recent call last):\n" + "  line\n" * 12
+    assert classify_request(traceback)["route"] == "large"
+
+
+@patch("groq_cli.get_client")
+def test_small_model_escalates_on_invalid_output(mock_get_client):
+    mock_create = mock_get_client.return_value.chat.completions.create
+
+    def create(model, **kwargs):
+        content = ("Sorry, I can't do that." if model == "llama-3.1-8b-instant"
+                   else json.dumps({"commands": [{"command": "ls -S"}]}))
+        return MagicMock(choices=[MagicMock(message=MagicMock(
+            content=content))])
+    mock_create.side_effect = create
+
+    with recording("query") as record:
+        result = get_commands("list files by size", use_cache=False)
+
+    assert result == {"commands": [{"command": "ls -S"}]}
+    assert [call.kwargs["model"] for call in mock_create.call_args_list] == [
+        "llama-3.1-8b-instant", "llama-3.1-70b-versatile"]
+    assert [call["model"] for call in record.calls] == [
+        "llama-3.1-8b-instant", "llama-3.1-70b-versatile"]
+    assert record.routes == [{"kind": "commands", "route": "large",
+                              "score": 0, "classified": "small",
+                              "escalated": True}]
+
+
+@pytest.fixture
+def use_stub(monkeypatch):
+    # Points the real client at a StubServer
+    def use(stub):
+        monkeypatch.setenv("GROQ_API_KEY", "stub")
+        monkeypatch.setenv("GROQ_BASE_URL", stub.url)
+        get_client.cache_clear()
+        return stub
+    yield use
+    get_client.cache_clear()
+
+
+class ModelStub(StubServer):
+    # Replies by the requested model
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = replies
+
+    def reply(self, body, index):
+        return self.replies.get(body["model"], Reply())
+
+
+def test_hedged_request_beats_slow_response(use_stub):
+    stub = ModelStub({"llama-3.1-8b-instant": Reply(chunk_delay=0.5)})
+    with use_stub(stub), recording("query") as record:
+        start = time.monotonic()
+        result = get_commands("disk usage", use_cache=False,
+                              hedge=HedgePolicy(0.2, None))
+        elapsed = time.monotonic() - start
+        deadline = time.monotonic() + 3
+        while not stub.cancelled and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    assert result["commands"][0]["command"] == "du -sh -- */ | sort -h"
+    assert elapsed < 2
+    assert stub.models == ["llama-3.1-8b-instant", "llama-3.1-70b-versatile"]
+    assert stub.cancelled == 1
+    assert record.routes[0]["route"] == "hedge"
+    assert record.counters["hedge.fired"] == 1
+
+
+def test_hedge_fires_at_once_on_invalid_response(use_stub):
+    stub = ModelStub({"llama-3.1-8b-instant": Reply(content="Sorry, no.")})
+    with use_stub(stub):
+        start = time.monotonic()
+        result = get_commands("disk usage", use_cache=False,
+                              hedge=HedgePolicy(30, "llama-3.1-70b-versatile"))
+
+    assert time.monotonic() - start < 5
+    assert len(result["commands"]) == 2
+    assert stub.models == ["llama-3.1-8b-instant", "llama-3.1-70b-versatile"]
+
+
+@patch("groq_cli._retry_delay", return_value=0)
+def test_create_completion_retries_server_errors(mock_delay, use_stub):
+    stub = StubServer(script=[Reply(status=503), Reply(status=502)])
+    with use_stub(stub), recording("query") as record:
+        result = get_commands("disk usage", use_cache=False)
+
+    assert len(result["commands"]) == 2
+    assert stub.requests == 3
+    assert record.counters["retried"] == 2
+
+
+def run_selector(items, keys, **kwargs):
+    # Drives a Selector from a pipe and captures each frame's writes
+    read_fd, write_fd = os.pipe()
+    out_read, out_write = os.pipe()
+    writes = []
+    real_write = os.write
+
+    def counting_write(fd, data):
+        if fd == out_write:
+            writes.append(data)
+        return real_write(fd, data)
+
+    with patch("groq_cli.os.write", side_effect=counting_write):
+        if isinstance(keys, str):
+            os.write(write_fd, keys.encode())
+        else:
+            def type_keys():
+                for key in keys:
+                    time.sleep(0.05)
+                    os.write(write_fd, key.encode())
+            threading.Thread(target=type_keys).start()
+        selector = Selector(items, "Pick one", fd=read_fd, out_fd=out_write,
+                            size=(60, 10), **kwargs)
+        result = selector.run()
+    for fd in (read_fd, write_fd, out_read, out_write):
+        os.close(fd)
+    return result, selector, writes
+
+
+def test_parse_keys():
+    assert parse_keys("\x1b[A\x1bOBab\r") == ["up", "down", "a", "b", "enter"]
+    assert parse_keys("\x1b[5~\x1b[6~\x7f\x03") == [
+        "pgup", "pgdn", "backspace", "ctrl-c"]
+    assert parse_keys("\x1b") == ["escape"]
+    assert parse_keys("\x1b[99Zx") == ["x"]
+
+
+def test_fuzzy_score_ranks_substrings_first():
+    assert fuzzy_score("log", "journalctl --since today") is None
+    assert fuzzy_score("du", "du -sh") < fuzzy_score("du", "d u")
+    assert fuzzy_score("gst", "git status") is not None
+    assert fuzzy_score("gst", "git status") < fuzzy_score("gst", "grep -r st x")
+
+
+def test_selector_moves_filters_and_selects():
+    items = [{"command": f"ls dir{i}", "description": f"list {i}"}
+             for i in range(20)]
+    items.append({"command": "git status", "description": "show changes"})
+
+    result, _, _ = run_selector(items, "\x1b[B\x1b[B\r")
+    assert result == items[2]
+
+    result, selector, _ = run_selector(items, "/gst\r")
+    assert result == items[-1]
+    assert selector.visible == [20]
+
+    result, _, _ = run_selector(items, "/gst\x1bc")
+    assert result is None
+
+
+def test_selector_joins_escape_sequences_split_across_reads():
+    items = [{"command": f"ls dir{i}", "description": ""} for i in range(3)]
+    # Keys are typed 50ms apart, so wait longer than that for the rest
+    with patch("groq_cli.ESCAPE_WAIT", 0.5):
+        result, _, _ = run_selector(items, ["\x1b", "[B", "\r"])
+    assert result == items[1]
+
+    # A lone ESC still cancels once nothing follows it
+    result, _, _ = run_selector(items, ["\x1b"])
+    assert result is None
+
+
+def test_selector_redraws_only_changed_lines():
+    items = [{"command": f"ls dir{i}", "description": f"list {i}"}
+             for i in range(20)]
+    result, selector, writes = run_selector(items, ["\x1b[B", "\r"])
+
+    assert result == items[1]
+    # One write for the first frame, one for the keypress, one on exit
+    assert len(writes) == 3
+    assert len(writes[1]) < len(writes[0]) / 2
+    assert b"\x1b[2J" not in writes[1]
+    # The viewport scrolls to keep the selection on screen
+    assert selector.top == 0
+    result, selector, _ = run_selector(items, ["\x1b[F", "\r"])
+    assert result == items[-1]
+    assert selector.top > 0
+
+
+def test_selector_shows_streamed_items():
+    items = []
+    stream = MagicMock()
+    stream.done = threading.Event()
+
+    def arrive():
+        time.sleep(0.2)
+        items.append({"command": "df -h", "description": "disk usage"})
+        stream.done.set()
+
+    read_fd, write_fd = os.pipe()
+    out_read, out_write = os.pipe()
+    threading.Thread(target=arrive).start()
+    threading.Timer(0.5, os.write, (write_fd, b"\r")).start()
+    result = Selector(items, "Pick one", stream=stream, fd=read_fd,
+                      out_fd=out_write, size=(60, 10)).run()
+    output = os.read(out_read, 65536)
+    for fd in (read_fd, write_fd, out_read, out_write):
+        os.close(fd)
+
+    assert result == items[0]
+    assert b"loading more commands" in output
+    assert b"df -h" in output
+
+
+def test_session_trims_history_to_budget():
+    session = Session(history_tokens=120)
+    reply = {"commands": [{"command": "du -sh *", "description": "x" * 500}]}
+    with patch("groq_cli.get_commands", return_value=reply), \
+            patch("groq_cli.fetch_commands", return_value=reply) as fetch:
+        session.ask("disk usage")
+        session.add_result("du -sh *", MagicMock(
+            returncode=0, stdout="4.0K\ta\n" * 500, stderr=""))
+        assert len(session.turns[0]["ran"][0]) < 1100
+        session.ask("only for *.log")
+
+    messages = fetch.call_args.args[2]
+    assert sum(m["content"] == COMMANDS_SYSTEM_PROMPT for m in messages) == 1
+    assert messages[-1]["content"] == "only for *.log"
+    assert "description" not in session.turns[-1]["reply"]
+    # The long output pushed the first turn out of the budget
+    assert [turn["query"] for turn in session.turns] == ["only for *.log"]
+    assert session.tokens() <= 120
+
+
+class RecordingStub(StubServer):
+    # Keeps the messages of every request
+    def __init__(self):
+        super().__init__()
+        self.bodies = []
+
+    def completion(self, body):
+        self.bodies.append(body)
+        return super().completion(body)
+
+
+@patch("groq_cli.display_and_select_command")
+def test_shell_feeds_back_output(mock_select, use_stub, capfd):
+    mock_select.return_value = [{"command": "echo shell-$((6 * 7))"}]
+    queries = iter(["print a number", "now double it"])
+
+    def fake_input(prompt):
+        try:
+            return next(queries)
+        except StopIteration:
+            raise EOFError
+
+    stub = RecordingStub()
+    with use_stub(stub), patch("builtins.input", fake_input):
+        shell_main(["--no-cache"])
+
+    assert stub.requests == 2
+    follow_up = stub.bodies[1]["messages"]
+    assert sum(m["role"] == "system" for m in follow_up) == \
+        sum(m["role"] == "system" for m in stub.bodies[0]["messages"])
+    assert "print a number" in follow_up[-4]["content"]
+    assert "shell-42" in follow_up[-2]["content"]
+    assert follow_up[-1]["content"] == "now double it"
+    records = [json.loads(line) for line in open(telemetry_path())]
+    assert [r["command"] for r in records] == ["shell", "shell"]
+    assert all("response" in r["timings"] for r in records)
+    assert "startup" in records[0]["timings"]
+    assert "shell-42" in capfd.readouterr().out
+
+
+def test_selector_marks_several_items():
+    items = [{"command": f"cmd{i}", "description": ""} for i in range(4)]
+    result, _, _ = run_selector(items, " \x1b[B \r", multi=True)
+    assert result == [items[0], items[2]]
+
+    result, _, _ = run_selector(items, "\x1b[B\r", multi=True)
+    assert result == [items[1]]
+
+    # Tab marks while filtering, where a space is part of the filter
+    result, _, _ = run_selector(items, "/3\t\x1b\r", multi=True)
+    assert result == [items[3]]
+
+
+@patch("groq_cli.display_and_select_solution", return_value=None)
+@patch("groq_cli.request_error_analysis")
+def test_execute_parallel_batches_failures(mock_analysis, mock_select, capfd):
+    mock_analysis.return_value = {
+        "explanation": "Both commands failed.",
+        "solutions": [{"description": "Retry", "command": "true"}],
+    }
+    results = []
+    commands = ["sleep 0.5; echo alpha", "sleep 0.5; echo beta >&2; exit 3",
+                "printf 'one\\ntwo'; exit 4"]
+    start = time.monotonic()
+    success = execute_parallel(
+        commands, jobs=3, on_result=lambda c, r: results.append((c, r)))
+
+    assert success is False
+    assert time.monotonic() - start < 1.4
+    assert sorted(r.returncode for _, r in results) == [0, 3, 4]
+    out, err = capfd.readouterr()
+    assert "[1]\x1b[0m alpha" in out
+    assert "[3]\x1b[0m one\n" in out and "[3]\x1b[0m two\n" in out
+    assert "[2]\x1b[0m beta" in err
+    assert "exit 3" in out and "exit 4" in out
+    # One analysis request covering both failures
+    assert mock_analysis.call_count == 1
+    context = mock_analysis.call_args.args[0]
+    assert commands[1] in context and commands[2] in context
+    assert mock_select.call_count == 1
 
 
 if __name__ == "__main__":